@@ -1,68 +1,367 @@
-from openai import AsyncOpenAI
-from typing import List, AsyncGenerator
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
+from collections.abc import AsyncGenerator
 import numpy as np
-from model import Document
+from model import Document, DocumentSegment
+from analysis.embedding_cache import EmbeddingCache
 import asyncio
+import base64
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def decode_embedding(encoded: str) -> np.ndarray:
+    """Decodes a base64 embedding from the API into a float32 vector without parsing floats."""
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+
+
+def l2_normalize(vectors: list[np.ndarray] | np.ndarray) -> np.ndarray:
+    """
+    Returns `vectors` as a float32 (n, dim) matrix with unit-length rows, so that
+    cosine similarity downstream reduces to a dot product.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
 
 
 class EmbeddingClient:
     MODEL_NAME = "text-embedding-3-small"
+    # The embeddings endpoint accepts up to 2048 inputs per request
+    MAX_BATCH_SIZE = 2048
+    DEFAULT_BATCH_SIZE = 256
+    DEFAULT_CONCURRENCY = 4
+    # Retries for rate-limited/transient failures; the OpenAI client backs off
+    # exponentially with jitter and honors Retry-After headers between attempts
+    DEFAULT_MAX_RETRIES = 6
+    # Per-request token ceiling of the embeddings endpoint
+    MAX_BATCH_TOKENS = 300_000
+    # Rough chars-per-token ratio used to estimate request size without a tokenizer
+    CHARS_PER_TOKEN = 4
+    # Maximum number of requests in a single Batch API input file
+    MAX_BATCH_API_REQUESTS = 50_000
 
     def __init__(
-        self, client: AsyncOpenAI | None = None, model_name: str | None = None
+        self,
+        client: AsyncOpenAI | None = None,
+        model_name: str | None = None,
+        batch_size: int | None = None,
+        concurrency: int | None = None,
+        cache: EmbeddingCache | None = None,
+        max_retries: int | None = None,
     ):
-        self.client = client if client else AsyncOpenAI()
+        if max_retries is None:
+            max_retries = int(
+                os.getenv("EMBEDDING_MAX_RETRIES", EmbeddingClient.DEFAULT_MAX_RETRIES)
+            )
+        if concurrency is None:
+            concurrency = int(
+                os.getenv("EMBEDDING_CONCURRENCY", EmbeddingClient.DEFAULT_CONCURRENCY)
+            )
+        concurrency = max(1, concurrency)
+        if not client:
+            # Keep one pooled keep-alive connection per in-flight request so
+            # consecutive batches reuse TLS sessions instead of reconnecting
+            client = AsyncOpenAI(
+                max_retries=max_retries,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=concurrency,
+                        max_keepalive_connections=concurrency,
+                    )
+                ),
+            )
+        self.client = client
+        self.cache = cache
         self.model_name = model_name if model_name else EmbeddingClient.MODEL_NAME
+        if batch_size is None:
+            batch_size = int(
+                os.getenv("EMBEDDING_BATCH_SIZE", EmbeddingClient.DEFAULT_BATCH_SIZE)
+            )
+        self.batch_size = max(1, min(batch_size, EmbeddingClient.MAX_BATCH_SIZE))
+        self._semaphore = asyncio.Semaphore(concurrency)
 
     async def get_embedding(
         self, text: str, model: str | None = None
     ) -> list[float] | None:
         """Generates an embedding for the given text using the specified OpenAI model."""
         model_to_use = model if model else self.model_name
-        text = text.replace("\n", " ")
-        response = await self.client.embeddings.create(input=[text], model=model_to_use)
-        return response.data[0].embedding
+        if self.cache:
+            cached = self.cache.get(model_to_use, text)
+            if cached is not None:
+                return cached.tolist()
+        embeddings = await self._embed_batch([text], model=model_to_use)
+        return embeddings[0].tolist()
+
+    async def _embed_batch(
+        self, texts: list[str], model: str | None = None
+    ) -> np.ndarray:
+        """
+        Embeds a batch of texts with a single request, preserving input order.
+        Returns the embeddings as unit-normalized float32 rows.
+        Results are written to the embedding cache, if one is configured, from a
+        worker thread so the blocking SQLite commit doesn't stall the event loop.
+        """
+        model_to_use = model if model else self.model_name
+        inputs = [text.replace("\n", " ") for text in texts]
+        async with self._semaphore:
+            response = await self.client.embeddings.create(
+                input=inputs, model=model_to_use, encoding_format="base64"
+            )
+        embeddings = l2_normalize(
+            [
+                decode_embedding(d.embedding)
+                for d in sorted(response.data, key=lambda d: d.index)
+            ]
+        )
+        if self.cache:
+            await asyncio.to_thread(
+                self.cache.set_many, model_to_use, list(zip(texts, embeddings))
+            )
+        return embeddings
+
+    def _batch_segments(
+        self, segments: list[DocumentSegment]
+    ) -> list[list[DocumentSegment]]:
+        """
+        Groups segments into request-sized batches, bounded both by the configured
+        batch size and by the estimated token count of a single request.
+        """
+        max_chars = EmbeddingClient.MAX_BATCH_TOKENS * EmbeddingClient.CHARS_PER_TOKEN
+        batches: list[list[DocumentSegment]] = []
+        current: list[DocumentSegment] = []
+        current_chars = 0
+        for segment in segments:
+            text_chars = len(segment.text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_chars + text_chars > max_chars
+            ):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append(segment)
+            current_chars += text_chars
+        if current:
+            batches.append(current)
+        return batches
+
+    def _segments_to_embed(self, doc: Document, model: str) -> list[DocumentSegment]:
+        """
+        Returns the segments of `doc` that still need an embedding, filling
+        segments whose text is already in the embedding cache along the way.
+        """
+        segments_to_embed = []
+        for segment in doc.segments:
+            # Check if embedding is None or an empty array
+            if segment.text and (
+                segment.embedding is None or segment.embedding.size == 0
+            ):
+                if self.cache:
+                    cached = self.cache.get(model, segment.text)
+                    if cached is not None:
+                        segment.embedding = cached
+                        continue
+                segments_to_embed.append(segment)
+        return segments_to_embed
+
+    @staticmethod
+    def _group_by_text(
+        segments: list[DocumentSegment],
+    ) -> dict[str, list[DocumentSegment]]:
+        """Groups segments by their normalized text, preserving first-seen order."""
+        groups: dict[str, list[DocumentSegment]] = {}
+        for segment in segments:
+            groups.setdefault(EmbeddingCache.normalize(segment.text), []).append(
+                segment
+            )
+        return groups
+
+    async def _embed_segment_batch(
+        self, batch: list[DocumentSegment], model: str | None = None
+    ) -> tuple[list[DocumentSegment], np.ndarray]:
+        """Embeds a batch of segments and returns it alongside its vectors."""
+        embedding_vectors = await self._embed_batch(
+            [segment.text for segment in batch], model=model
+        )
+        return batch, embedding_vectors
 
     async def embed_documents(
-        self, documents: List[Document], model: str | None = None
-    ) -> AsyncGenerator[Document, None]:
+        self, documents: list[Document], model: str | None = None
+    ) -> AsyncGenerator[Document]:
         """
         Embeds the text of each segment in a list of Document objects.
         Updates the 'embedding' field of each DocumentSegment.
-        Only embeds segments that do not already have an embedding.
-        Yields each document after its segments have been processed.
+        Only embeds segments that do not already have an embedding, and
+        reuses cached embeddings for previously seen text. Identical texts are
+        embedded once and the result is shared by every segment carrying them.
+        Segments from all documents are sent in batches, one request per batch,
+        with a bounded number of requests in flight at a time.
+        Yields each document as soon as all of its segments have been embedded
+        and packed into the document's embedding matrix, so documents may be
+        yielded out of input order.
         """
         model_to_use = model if model else self.model_name
         if not self.client:
-            print("OpenAI client not initialized. Cannot embed documents.")
+            logger.warning("OpenAI client not initialized. Cannot embed documents.")
             # Yield documents as they are if client not initialized
             for doc in documents:
                 yield doc
             return
 
-        for doc in documents:  # Iterate through documents one by one
-            segments_to_embed = []
-            for segment in doc.segments:
-                # Check if embedding is None or an empty array
-                if segment.text and (
-                    segment.embedding is None or segment.embedding.size == 0
-                ):
-                    segments_to_embed.append(segment)
-
-            if not segments_to_embed:
+        segments_to_embed: list[DocumentSegment] = []
+        # Owning document of each pending segment, and pending count per document
+        segment_owner: dict[int, Document] = {}
+        pending_counts: dict[int, int] = {}
+        for doc in documents:
+            doc_segments = self._segments_to_embed(doc, model_to_use)
+            if not doc_segments:
+                doc.pack_embeddings()
                 yield doc  # Yield doc if no segments to embed
                 continue
+            segments_to_embed.extend(doc_segments)
+            for segment in doc_segments:
+                segment_owner[id(segment)] = doc
+            pending_counts[id(doc)] = len(doc_segments)
+
+        # Only one representative segment per distinct text is sent to the API
+        text_groups = self._group_by_text(segments_to_embed)
+        representatives = [group[0] for group in text_groups.values()]
+        tasks = [
+            asyncio.ensure_future(self._embed_segment_batch(batch, model=model_to_use))
+            for batch in self._batch_segments(representatives)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                batch, embedding_vectors = await next_done
+                for representative, embedding_vector in zip(batch, embedding_vectors):
+                    for segment in text_groups[
+                        EmbeddingCache.normalize(representative.text)
+                    ]:
+                        segment.embedding = embedding_vector
+                        doc = segment_owner[id(segment)]
+                        pending_counts[id(doc)] -= 1
+                        if pending_counts[id(doc)] == 0:
+                            doc.pack_embeddings()
+                            yield doc  # Yield the processed document
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def embed_documents_batch_api(
+        self,
+        documents: list[Document],
+        model: str | None = None,
+        poll_interval: float = 30.0,
+        max_poll_interval: float = 600.0,
+    ) -> list[Document]:
+        """
+        Embeds all pending segments through the OpenAI Batch API instead of the
+        realtime endpoint. Batch jobs cost half as much and use a separate rate
+        limit pool, but may take up to 24 hours, so this is meant for offline
+        bulk ingestion only.
+        Segments are submitted as one JSONL request per distinct text, the job is
+        polled with exponential backoff, and the results are mapped back onto
+        the segments by custom_id. Returns the documents with packed embeddings.
+        """
+        model_to_use = model if model else self.model_name
+        segments_to_embed: list[DocumentSegment] = []
+        for doc in documents:
+            segments_to_embed.extend(self._segments_to_embed(doc, model_to_use))
+        text_groups = self._group_by_text(segments_to_embed)
+        representatives = [group[0] for group in text_groups.values()]
+
+        for i in range(0, len(representatives), EmbeddingClient.MAX_BATCH_API_REQUESTS):
+            job_segments = representatives[
+                i : i + EmbeddingClient.MAX_BATCH_API_REQUESTS
+            ]
+            embeddings_by_id = await self._run_batch_api_job(
+                job_segments, model_to_use, poll_interval, max_poll_interval
+            )
+            embedding_matrix = l2_normalize(
+                [embeddings_by_id[segment.id] for segment in job_segments]
+            )
+            for representative, embedding_vector in zip(job_segments, embedding_matrix):
+                for segment in text_groups[
+                    EmbeddingCache.normalize(representative.text)
+                ]:
+                    segment.embedding = embedding_vector
+            if self.cache:
+                self.cache.set_many(
+                    model_to_use,
+                    ((segment.text, segment.embedding) for segment in job_segments),
+                )
+
+        for doc in documents:
+            doc.pack_embeddings()
+        return documents
+
+    async def _run_batch_api_job(
+        self,
+        segments: list[DocumentSegment],
+        model: str,
+        poll_interval: float,
+        max_poll_interval: float,
+    ) -> dict[str, np.ndarray]:
+        """Runs a single Batch API job and returns the embeddings keyed by segment ID."""
+        request_lines = [
+            json.dumps(
+                {
+                    "custom_id": segment.id,
+                    "method": "POST",
+                    "url": "/v1/embeddings",
+                    "body": {
+                        "model": model,
+                        "input": segment.text.replace("\n", " "),
+                        "encoding_format": "base64",
+                    },
+                },
+                ensure_ascii=False,
+            )
+            for segment in segments
+        ]
+        input_file = await self.client.files.create(
+            file=("embeddings.jsonl", "\n".join(request_lines).encode("utf-8")),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h",
+        )
+        logger.info(
+            "Created embedding batch %s with %d requests.", batch.id, len(segments)
+        )
 
-            # Process segments_to_embed in batches for the current document
-            batch_size = 10  # OpenAI API batch limit or your preference
-            for i in range(0, len(segments_to_embed), batch_size):
-                batch_segments = segments_to_embed[i : i + batch_size]
-                tasks = [
-                    self.get_embedding(segment.text, model=model_to_use)
-                    for segment in batch_segments
-                ]
-                embedding_vectors = await asyncio.gather(*tasks)
-                for segment, embedding_vector in zip(batch_segments, embedding_vectors):
-                    if embedding_vector is not None:
-                        segment.embedding = np.array(embedding_vector)
-            yield doc  # Yield the processed document
+        wait = poll_interval
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(wait)
+            wait = min(wait * 2, max_poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+            logger.info("Embedding batch %s status: %s", batch.id, batch.status)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(
+                f"Embedding batch {batch.id} ended with status '{batch.status}'."
+            )
+
+        output = await self.client.files.content(batch.output_file_id)
+        embeddings_by_id: dict[str, list[float]] = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response")
+            if result.get("error") or not response or response["status_code"] != 200:
+                raise RuntimeError(
+                    f"Embedding request {result['custom_id']} in batch {batch.id} failed: {result.get('error') or response}"
+                )
+            embeddings_by_id[result["custom_id"]] = decode_embedding(
+                response["body"]["data"][0]["embedding"]
+            )
+        return embeddings_by_id
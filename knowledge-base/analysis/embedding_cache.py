@@ -0,0 +1,81 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from collections.abc import Iterable
+
+import numpy as np
+
+from model import EMBEDDING_DTYPE
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by SQLite.
+    Entries are keyed on (model name, sha256 of the normalized text) and stored
+    as float32 bytes, so identical text is only ever embedded once per model and a
+    cache hit returns exactly the vector the API returned.
+    The connection may be used from worker threads (e.g. via asyncio.to_thread);
+    a lock serializes access to it.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalizes text the same way it is sent to the embedding API."""
+        return text.replace("\n", " ")
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(
+            EmbeddingCache.normalize(text).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, model: str, text: str) -> np.ndarray | None:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                (model, self.text_hash(text)),
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=EMBEDDING_DTYPE)
+
+    def set_many(
+        self, model: str, items: Iterable[tuple[str, list[float] | np.ndarray]]
+    ) -> None:
+        """Stores (text, embedding) pairs in a single transaction."""
+        rows = [
+            (
+                model,
+                self.text_hash(text),
+                np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes(),
+            )
+            for text, vector in items
+        ]
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
@@ -1,39 +1,95 @@
+import functools
+import logging
+import re
+from hashlib import blake2b
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import nltk
 from nltk.corpus import stopwords
-from bertopic import BERTopic
-from sklearn.feature_extraction.text import CountVectorizer
 import numpy as np
-import spacy
 from langdetect import detect, LangDetectException
 
 from model import DocumentSegment, Topic
 
+logger = logging.getLogger(__name__)
+
+# bertopic, umap, sklearn, spacy and cuML are imported where they are used, so
+# importing this module (e.g. for topics_to_pydantic) stays cheap
+if TYPE_CHECKING:
+    from bertopic import BERTopic
+    from umap import UMAP
+
+# Above this many segments, CPU HDBSCAN's pairwise-distance step dominates runtime
+LARGE_CORPUS_THRESHOLD = 20_000
+
 # Ensure NLTK data is available
 try:
     nltk.data.find("corpora/stopwords")
 except LookupError:  # Catch LookupError if resource not found
     nltk.download("stopwords", quiet=True)
 
-# Prepare combined stopword list for English & Swedish
-SW_STOPWORDS = list(stopwords.words("swedish"))
-EN_STOPWORDS = list(stopwords.words("english"))
-COMBINED_STOPWORDS = list(
-    set(SW_STOPWORDS) | set(EN_STOPWORDS)
-)  # Use set union for unique words
+# Prepare combined stopword set for English & Swedish (frozenset for O(1) lookups)
+SW_STOPWORDS = frozenset(stopwords.words("swedish"))
+EN_STOPWORDS = frozenset(stopwords.words("english"))
+COMBINED_STOPWORDS = SW_STOPWORDS | EN_STOPWORDS
+# Stopwords unique to one language, used as a fast Swedish/English classifier
+SW_ONLY_STOPWORDS = SW_STOPWORDS - EN_STOPWORDS
+EN_ONLY_STOPWORDS = EN_STOPWORDS - SW_STOPWORDS
+WORD_PATTERN = re.compile(r"\w+")
+# The stopword count decides the language only with at least this many hits, and
+# when the leading language has at least STOPWORD_HIT_RATIO times the other's hits
+MIN_STOPWORD_HITS = 3
+STOPWORD_HIT_RATIO = 2
+# langdetect codes lemmatized with the Swedish pipeline; short Swedish texts are
+# often reported as Norwegian or Danish. Every other code uses the English one
+SWEDISH_LANGDETECT_CODES = frozenset({"sv", "no", "da"})
 
 
-# Load spaCy models for English and Swedish (download if missing)
-try:
-    nlp_en = spacy.load("en_core_web_sm", disable=["parser", "ner"])
-except OSError:
-    spacy.cli.download("en_core_web_sm")
-    nlp_en = spacy.load("en_core_web_sm", disable=["parser", "ner"])
+@functools.cache
+def _load_spacy_model(name: str):
+    """Loads a spaCy pipeline on first use (downloading it if missing)."""
+    import spacy
+
+    try:
+        return spacy.load(name, disable=["parser", "ner"])
+    except OSError:
+        spacy.cli.download(name)
+        return spacy.load(name, disable=["parser", "ner"])
 
-try:
-    nlp_sv = spacy.load("sv_core_news_sm", disable=["parser", "ner"])
-except OSError:
-    spacy.cli.download("sv_core_news_sm")
-    nlp_sv = spacy.load("sv_core_news_sm", disable=["parser", "ner"])
+
+def _nlp_en():
+    return _load_spacy_model("en_core_web_sm")
+
+
+def _nlp_sv():
+    return _load_spacy_model("sv_core_news_sm")
+
+
+def detect_language(text: str) -> str:
+    """
+    Classify lowercased `text` as Swedish ("sv") or English ("en") by counting
+    stopwords unique to each language. Texts with too few hits or no clear
+    majority (e.g. short segments or an English quote in Swedish text) fall back
+    to the much slower `langdetect`, and to English if that fails too.
+    """
+    sv_hits = 0
+    en_hits = 0
+    for word in WORD_PATTERN.findall(text):
+        if word in SW_ONLY_STOPWORDS:
+            sv_hits += 1
+        elif word in EN_ONLY_STOPWORDS:
+            en_hits += 1
+    if sv_hits + en_hits >= MIN_STOPWORD_HITS:
+        if sv_hits >= STOPWORD_HIT_RATIO * en_hits:
+            return "sv"
+        if en_hits >= STOPWORD_HIT_RATIO * sv_hits:
+            return "en"
+    try:
+        lang = detect(text)
+    except LangDetectException:
+        return "en"
+    return "sv" if lang in SWEDISH_LANGDETECT_CODES else "en"
 
 
 def lemmatize_and_tokenize(doc: str) -> list[str]:
@@ -42,13 +98,9 @@ def lemmatize_and_tokenize(doc: str) -> list[str]:
     extract lemmas for alphabetic, non-stopword tokens, and return as a token list.
     """
     text = doc.lower().strip()
-    # Fallback to English if detection fails
-    try:
-        lang = detect(text)
-    except LangDetectException:
-        lang = "en"
+    lang = detect_language(text)
     # Choose pipeline
-    nlp = nlp_sv if lang.startswith("sv") else nlp_en
+    nlp = _nlp_sv() if lang == "sv" else _nlp_en()
     spacy_doc = nlp(text)
     lemmas = [
         token.lemma_
@@ -58,16 +110,160 @@ def lemmatize_and_tokenize(doc: str) -> list[str]:
     return lemmas
 
 
+def _pipe_lemmatize(
+    texts: list[str], n_process: int = 1, batch_size: int = 64
+) -> list[list[str]]:
+    """
+    Corpus-level equivalent of `lemmatize_and_tokenize`.
+    Texts are grouped by detected language and each group is streamed through
+    its spaCy pipeline with `nlp.pipe`, then reassembled in input order.
+    """
+    lowered = [text.lower().strip() for text in texts]
+    sv_indices: list[int] = []
+    en_indices: list[int] = []
+    for i, text in enumerate(lowered):
+        lang = detect_language(text)
+        (sv_indices if lang == "sv" else en_indices).append(i)
+
+    lemmatized: list[list[str]] = [[] for _ in texts]
+    for load_nlp, indices in ((_nlp_sv, sv_indices), (_nlp_en, en_indices)):
+        if not indices:
+            continue
+        nlp = load_nlp()
+        spacy_docs = nlp.pipe(
+            (lowered[i] for i in indices), batch_size=batch_size, n_process=n_process
+        )
+        for i, spacy_doc in zip(indices, spacy_docs):
+            lemmatized[i] = [
+                token.lemma_
+                for token in spacy_doc
+                if token.is_alpha and token.lemma_ not in COMBINED_STOPWORDS
+            ]
+    return lemmatized
+
+
+class CachedUMAP:
+    """
+    UMAP reducer for BERTopic that caches its reduced embeddings on disk, keyed on
+    a hash of the input embedding matrix and the UMAP parameters.
+    On a cache hit the UMAP fit is skipped entirely; such an instance can only
+    transform the exact matrix it was fitted on.
+    Only the MAX_CACHED_REDUCTIONS most recently used reductions are kept; older
+    ones are deleted whenever a new reduction is written.
+    """
+
+    MAX_CACHED_REDUCTIONS = 4
+
+    def __init__(self, cache_dir: Path, **umap_params):
+        # Same defaults BERTopic uses for its own UMAP model with low_memory=True
+        self.umap_params = {
+            "n_neighbors": 15,
+            "n_components": 5,
+            "min_dist": 0.0,
+            "metric": "cosine",
+            "low_memory": True,
+        } | umap_params
+        self.cache_dir = cache_dir
+        self.umap_model: UMAP | None = None
+        self._fitted_key: str | None = None
+        self._cached_reduction: np.ndarray | None = None
+
+    def _cache_key(self, embeddings: np.ndarray) -> str:
+        digest = blake2b(
+            np.ascontiguousarray(embeddings).tobytes(), digest_size=16
+        ).hexdigest()
+        params = "_".join(f"{k}-{v}" for k, v in sorted(self.umap_params.items()))
+        return f"{digest}_{params}"
+
+    def fit(self, embeddings: np.ndarray, y=None) -> "CachedUMAP":
+        key = self._cache_key(embeddings)
+        cache_path = self.cache_dir / f"{key}.npy"
+        self._fitted_key = key
+        if cache_path.exists():
+            logger.info("Using cached UMAP reduction from %s.", cache_path)
+            self._cached_reduction = np.load(cache_path)
+            # Mark the entry as recently used, so eviction keeps it
+            cache_path.touch()
+            return self
+
+        from umap import UMAP
+
+        self.umap_model = UMAP(**self.umap_params)
+        self._cached_reduction = self.umap_model.fit_transform(embeddings, y=y)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        np.save(cache_path, self._cached_reduction)
+        self._evict_stale_reductions()
+        return self
+
+    def _evict_stale_reductions(self) -> None:
+        """Deletes all but the MAX_CACHED_REDUCTIONS most recently used reductions."""
+        cached_paths = sorted(
+            self.cache_dir.glob("*.npy"),
+            key=lambda path: path.stat().st_mtime_ns,
+            reverse=True,
+        )
+        for stale_path in cached_paths[CachedUMAP.MAX_CACHED_REDUCTIONS :]:
+            stale_path.unlink()
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        if self._cached_reduction is not None and (
+            self._cache_key(embeddings) == self._fitted_key
+        ):
+            return self._cached_reduction
+        if self.umap_model is None:
+            raise ValueError(
+                "CachedUMAP was restored from cache and can only transform the embeddings it was fitted on."
+            )
+        return self.umap_model.transform(embeddings)
+
+
+def build_cluster_model(
+    n_segments: int, min_topic_size: int, nr_topics: int | None = None
+):
+    """
+    Chooses the clustering model BERTopic should use.
+    Uses GPU HDBSCAN from cuML when it is installed. On CPU, corpora above
+    LARGE_CORPUS_THRESHOLD segments are clustered with MiniBatchKMeans, which
+    avoids HDBSCAN's pairwise distances. Returns None to keep BERTopic's default
+    HDBSCAN otherwise.
+    """
+    try:
+        from cuml.cluster import HDBSCAN as cuHDBSCAN
+    except ImportError:  # cuML is only available on CUDA machines
+        cuHDBSCAN = None
+
+    if cuHDBSCAN is not None:
+        return cuHDBSCAN(
+            min_cluster_size=min_topic_size, metric="euclidean", prediction_data=True
+        )
+    if n_segments >= LARGE_CORPUS_THRESHOLD:
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_clusters = (
+            nr_topics
+            if isinstance(nr_topics, int)
+            else max(2, n_segments // (min_topic_size * 10))
+        )
+        return MiniBatchKMeans(n_clusters=n_clusters, n_init=3, random_state=42)
+    return None
+
+
 def extract_topics(
     segments: list[DocumentSegment],
     nr_topics: int | None = None,
     min_topic_size: int = 10,
     top_n_words: int = 10,
-) -> tuple[BERTopic, dict[str, int]]:
+    n_process: int = 1,
+    reduction_cache_dir: Path | None = None,
+) -> tuple["BERTopic", dict[str, int]]:
     """
     Extracts topics from a list of DocumentSegment objects and returns the fitted BERTopic model
     along with a mapping of segment IDs to their assigned topic IDs.
     Only segments with non-empty text and existing embeddings are used for topic modeling.
+    Segment texts are lemmatized up front in batches (using `n_process` spaCy workers),
+    so the vectorizer only has to split on whitespace.
+    If `reduction_cache_dir` is given, the UMAP reduction is cached there and
+    reused while the embedding matrix is unchanged.
     """
     # Filter segments that have text and embeddings
     valid_segments = [
@@ -82,38 +278,33 @@ def extract_topics(
         )
 
     texts = [seg.text for seg in valid_segments]
-    # Ensure embeddings is a 2D array
-    embeddings = np.array(
-        [seg.embedding for seg in valid_segments if seg.embedding is not None]
-    )
-    if embeddings.ndim == 1:  # Should not happen if embeddings are correctly generated
-        print(
-            f"Warning: Embeddings array is 1D, attempting to reshape. Shape: {embeddings.shape}"
-        )
-        if embeddings.shape[0] > 0 and embeddings.shape[0] % len(valid_segments) == 0:
-            # This is a heuristic, assuming all embeddings have the same known dimension if it was flattened
-            try:
-                # Attempt to infer embedding dimension, e.g. 1536 for text-embedding-3-small
-                # This part is risky without knowing the exact embedding dimension used.
-                # For now, we'll rely on UMAP/PCA to handle it or error out if incompatible.
-                # A better fix would be to ensure embeddings are always stored/retrieved as 2D.
-                pass  # PCA might handle it or fail gracefully.
-            except Exception as e:
-                print(
-                    f"Could not reshape embeddings, proceeding with 1D array which might fail: {e}"
-                )
+    # Preallocate the 2D float32 matrix and copy each row in place
+    dim = valid_segments[0].embedding.shape[0]
+    embeddings = np.empty((len(valid_segments), dim), dtype=np.float32)
+    for i, seg in enumerate(valid_segments):
+        embeddings[i] = seg.embedding
+
+    logger.info("Lemmatizing...")
+    lemmatized_texts = [
+        " ".join(lemmas) for lemmas in _pipe_lemmatize(texts, n_process=n_process)
+    ]
+
+    from bertopic import BERTopic
+    from sklearn.feature_extraction.text import CountVectorizer
 
-    print("Vectorizing...")
+    logger.info("Vectorizing...")
     vectorizer = CountVectorizer(
-        tokenizer=lemmatize_and_tokenize,
+        tokenizer=str.split,  # texts are already lemmatized and stopword-filtered
         token_pattern=None,  # disable default pattern so tokenizer is used
+        lowercase=False,  # texts are lowercased before lemmatization
         ngram_range=(1, 2),
         max_df=0.90,
         min_df=0.05,
         max_features=2_000,
+        dtype=np.int32,  # halves the count matrix compared to the int64 default
     )
 
-    print("Fitting BERTopic...")
+    logger.info("Fitting BERTopic...")
     topic_model = BERTopic(
         nr_topics=nr_topics,
         vectorizer_model=vectorizer,
@@ -121,11 +312,15 @@ def extract_topics(
         top_n_words=top_n_words,
         low_memory=True,
         language="multilingual",
+        umap_model=CachedUMAP(reduction_cache_dir) if reduction_cache_dir else None,
+        hdbscan_model=build_cluster_model(
+            len(valid_segments), min_topic_size, nr_topics
+        ),
     )
 
     # Fit using reduced embeddings
-    topic_assignments, _ = topic_model.fit_transform(texts, embeddings)
-    print("Fitted BERTopic.")
+    topic_assignments, _ = topic_model.fit_transform(lemmatized_texts, embeddings)
+    logger.info("Fitted BERTopic.")
 
     # Create a map from segment ID to topic ID
     segment_id_to_topic_id_map: dict[str, int] = {}
@@ -133,8 +328,9 @@ def extract_topics(
         if (
             segment.id is None
         ):  # Should ideally not happen if DocumentSegment.id is always set
-            print(
-                f"Warning: Segment encountered without an ID during topic assignment: {segment.text[:50]}..."
+            logger.warning(
+                "Segment encountered without an ID during topic assignment: %s...",
+                segment.text[:50],
             )
             continue
         segment_id_to_topic_id_map[segment.id] = int(topic_id)
@@ -143,7 +339,7 @@ def extract_topics(
     return topic_model, segment_id_to_topic_id_map
 
 
-def topics_to_pydantic(topic_model: BERTopic) -> list[Topic]:
+def topics_to_pydantic(topic_model: "BERTopic") -> list[Topic]:
     """
     Converts topics from a fitted BERTopic model to a list of Pydantic Topic models.
     Builds a human-readable name and description for each topic
@@ -155,8 +351,8 @@ def topics_to_pydantic(topic_model: BERTopic) -> list[Topic]:
     if not hasattr(topic_model, "get_topic_info") or not hasattr(
         topic_model, "get_topic"
     ):
-        print(
-            "Warning: Topic model does not seem to be fitted or is a dummy model. Returning empty topics."
+        logger.warning(
+            "Topic model does not seem to be fitted or is a dummy model. Returning empty topics."
         )
         return pydantic_topics
 
@@ -165,8 +361,8 @@ def topics_to_pydantic(topic_model: BERTopic) -> list[Topic]:
         and topic_model.topic_embeddings_ is not None
     )
     if not topic_embeddings_available:
-        print(
-            "Warning: topic_model.topic_embeddings_ is not available. Topics will be created without embeddings."
+        logger.warning(
+            "topic_model.topic_embeddings_ is not available. Topics will be created without embeddings."
         )
 
     topic_info_df = topic_model.get_topic_info()
@@ -182,7 +378,7 @@ def topics_to_pydantic(topic_model: BERTopic) -> list[Topic]:
         if not kw_scores:
             # This case might occur if a topic ID exists in get_topic_info but not in get_topic
             # Or if it's an empty topic.
-            print(f"Warning: No keywords found for topic {tid}. Skipping.")
+            logger.warning("No keywords found for topic %s. Skipping.", tid)
             continue
 
         # Filter out empty or whitespace-only strings from keywords
@@ -206,8 +402,11 @@ def topics_to_pydantic(topic_model: BERTopic) -> list[Topic]:
             if 0 <= df_idx < len(topic_model.topic_embeddings_):
                 topic_embedding = topic_model.topic_embeddings_[df_idx]
             else:
-                print(
-                    f"Warning: DataFrame index {df_idx} is out of bounds for topic_embeddings_ (len {len(topic_model.topic_embeddings_)}). Topic {tid} will not have an embedding."
+                logger.warning(
+                    "DataFrame index %s is out of bounds for topic_embeddings_ (len %d). Topic %s will not have an embedding.",
+                    df_idx,
+                    len(topic_model.topic_embeddings_),
+                    tid,
                 )
 
         pydantic_topics.append(
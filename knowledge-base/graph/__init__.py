@@ -1,6 +1,12 @@
 import json
-from neo4j import GraphDatabase
-from model import Topic, Document
+import logging
+import os
+from contextlib import contextmanager
+import numpy as np
+from neo4j import GraphDatabase, Session
+from model import EMBEDDING_DTYPE, Topic, Document
+
+logger = logging.getLogger(__name__)
 
 # 1) Define your schema in Python
 SCHEMA = {
@@ -29,7 +35,10 @@ SCHEMA = {
             "name": "doc_path_idx",
             "cypher": "INDEX doc_path_idx IF NOT EXISTS FOR (n:Document) ON (n.path)",
         },
-        # vector indexes for fast embedding search (requires Neo4j vector plugin)
+    ],
+    # vector indexes for fast embedding search (requires Neo4j vector plugin);
+    # created after bulk loads so writes don't pay for HNSW insertion
+    "vector_indexes": [
         {
             "name": "topic_embedding_idx",
             "cypher": "VECTOR INDEX topic_embedding_idx IF NOT EXISTS FOR (n:Topic) ON (n.embedding) OPTIONS { indexConfig: { `vector.dimensions`: 1536, `vector.similarity_function`: 'cosine'} }",
@@ -44,24 +53,71 @@ SCHEMA = {
 
 class SchemaManager:
     def __init__(self, uri: str, user: str, password: str):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.driver = GraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=int(os.getenv("NEO4J_POOL_SIZE", "50")),
+        )
+        self._session: Session | None = None
+
+    def __enter__(self) -> "SchemaManager":
+        """Opens one session that is reused by every operation until exit."""
+        self._session = self.driver.session()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._session.close()
+        self._session = None
+        self.close()
 
     def close(self):
         self.driver.close()
 
+    @contextmanager
+    def _session_scope(self):
+        """Yields the shared session when used as a context manager, else a fresh one."""
+        if self._session is not None:
+            yield self._session
+        else:
+            with self.driver.session() as session:
+                yield session
+
     def apply_schema(self) -> None:
         """Create constraints & indexes if they don't already exist."""
-        with self.driver.session() as session:
+        self.apply_constraints()
+        self.apply_vector_indexes()
+
+    def apply_constraints(self) -> None:
+        """Create constraints & look-up indexes if they don't already exist; run before upserts."""
+        with self._session_scope() as session:
             for ct in SCHEMA["constraints"]:
                 stmt = f"CREATE {ct['cypher']}"
                 session.run(stmt)
             for idx in SCHEMA["indexes"]:
                 stmt = f"CREATE {idx['cypher']}"
                 session.run(stmt)
+            # Wait until the freshly created constraints and indexes are online, so
+            # subsequent MERGEs use them instead of scanning
+            session.run("CALL db.awaitIndexes()").consume()
 
-    def clear_database(self) -> None:
-        """Remove all data, indexes, and constraints from the database."""
-        with self.driver.session() as session:
+    def apply_vector_indexes(self) -> None:
+        """
+        Create vector indexes if they don't already exist; run after bulk upserts,
+        so the indexes are built once over the loaded embeddings.
+        """
+        with self._session_scope() as session:
+            for idx in SCHEMA["vector_indexes"]:
+                stmt = f"CREATE {idx['cypher']}"
+                session.run(stmt)
+            session.run("CALL db.awaitIndexes()").consume()
+
+    def clear_database(self, batch_size: int = 50_000) -> None:
+        """
+        Remove all data, indexes, and constraints from the database.
+        Schema drops and each batch of `batch_size` node deletions run as separate
+        auto-commit transactions.
+        """
+        with self._session_scope() as session:
             # Drop all constraints
             for ct in SCHEMA["constraints"]:
                 stmt = f"DROP CONSTRAINT {ct['name']} IF EXISTS"
@@ -69,136 +125,201 @@ class SchemaManager:
                     session.run(stmt)
                 except Exception as e:
                     # It's okay if a constraint doesn't exist when we try to drop it
-                    print(f"Error dropping constraint {ct['name']}: {e}")
+                    logger.warning("Error dropping constraint %s: %s", ct["name"], e)
 
             # Drop all indexes
-            for idx in SCHEMA["indexes"]:
+            for idx in SCHEMA["indexes"] + SCHEMA["vector_indexes"]:
                 index_name = idx["name"]
                 stmt = f"DROP INDEX {index_name} IF EXISTS"
                 try:
                     session.run(stmt)
                 except Exception as e:
                     # It's okay if an index doesn't exist when we try to drop it
-                    print(f"Error dropping index {index_name}: {e}")
+                    logger.warning("Error dropping index %s: %s", index_name, e)
+
+            # Delete all nodes and relationships in bounded transactions, so large
+            # graphs don't have to fit into a single transaction's memory
+            while True:
+                deleted = session.run(
+                    "MATCH (n) WITH n LIMIT $limit DETACH DELETE n RETURN count(n) AS c",
+                    limit=batch_size,
+                ).single()["c"]
+                if deleted == 0:
+                    break
+            logger.info("Database nuked: all data, indexes, and constraints removed.")
 
-            # Delete all nodes and relationships
-            session.run("MATCH (n) DETACH DELETE n")
-            print("Database nuked: all data, indexes, and constraints removed.")
+    @staticmethod
+    def _write_rows_tx(tx, query: str, rows: list[dict]) -> None:
+        tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def _write_in_batches(session, query: str, rows: list[dict], batch_size: int):
+        """Runs an `UNWIND $rows` write query over `rows` in chunks of `batch_size`."""
+        for i in range(0, len(rows), batch_size):
+            session.execute_write(
+                SchemaManager._write_rows_tx, query, rows[i : i + batch_size]
+            )
+
+    @staticmethod
+    def _embedding_param(embedding: np.ndarray | None) -> list[float] | None:
+        """Casts an embedding once to the float32 list the vector indexes expect."""
+        if embedding is None:
+            return None
+        return embedding.astype(EMBEDDING_DTYPE, copy=False).tolist()
 
     def upsert_topic(self, topic: Topic) -> None:
-        with self.driver.session() as session:
-            session.run(
+        self.upsert_topics([topic])
+
+    def upsert_topics(self, topics: list[Topic], batch_size: int = 5000) -> None:
+        """Upserts all topics with one UNWIND statement per batch."""
+        rows = [
+            {
+                "id": topic.id,
+                "name": topic.name,
+                "description": topic.description,
+                "embedding": self._embedding_param(topic.embedding),
+            }
+            for topic in topics
+        ]
+        with self._session_scope() as session:
+            self._write_in_batches(
+                session,
                 """
-                MERGE (t:Topic {id:$id})
-                SET t.name       = $name,
-                    t.description= $description,
-                    t.embedding  = $embedding
+                UNWIND $rows AS row
+                MERGE (t:Topic {id:row.id})
+                SET t.name       = row.name,
+                    t.description= row.description
+                // Drop a stale vector when the topic no longer has an embedding
+                FOREACH (_ IN CASE WHEN row.embedding IS NULL THEN [1] ELSE [] END |
+                    REMOVE t.embedding)
+                WITH t, row
+                WHERE row.embedding IS NOT NULL
+                CALL db.create.setNodeVectorProperty(t, 'embedding', row.embedding)
                 """,
-                id=topic.id,
-                name=topic.name,
-                description=topic.description,
-                embedding=topic.embedding.tolist()
-                if topic.embedding is not None
-                else None,
+                rows,
+                batch_size,
             )
 
     def upsert_document(self, doc: Document) -> None:
-        with self.driver.session() as session:
-            # upsert Document node
-            session.run(
+        self.upsert_documents([doc])
+
+    @staticmethod
+    def _document_row(doc: Document, seg_ids_by_topic: dict[int, list[str]]) -> dict:
+        """
+        Builds the row for one document, with its segment rows nested inside it.
+        In the same pass, each segment with a topic is added to `seg_ids_by_topic`.
+        """
+        segment_rows = []
+        for seg in doc.segments:
+            if seg.topic_id is not None:
+                seg_ids_by_topic.setdefault(seg.topic_id, []).append(seg.id)
+            segment_rows.append(
+                {
+                    "seg_id": seg.id,
+                    "text": seg.text,
+                    "start_index": seg.start_index,
+                    "end_index": seg.end_index,
+                    "page": seg.page,
+                    # Neo4j properties can't hold maps, so metadata stays compact JSON
+                    "metadata": json.dumps(seg.metadata, separators=(",", ":"))
+                    if seg.metadata is not None
+                    else None,
+                    "embedding": SchemaManager._embedding_param(seg.embedding),
+                    "public_url": seg.public_url,
+                    "type": seg.type,
+                }
+            )
+        return {
+            "id": doc.id,
+            "path": doc.path,
+            "raw_content": doc.raw_content,
+            "segments": segment_rows,
+        }
+
+    @staticmethod
+    def _upsert_documents_tx(
+        tx, document_rows: list[dict], mention_rows: list[dict]
+    ) -> None:
+        """Writes a batch of documents with their segments and relationships in one transaction."""
+        # Upsert Document nodes, then their segments; each Document is looked up
+        # once through its id constraint and stays bound for its segments
+        tx.run(
+            """
+            UNWIND $rows AS row
+            MERGE (d:Document {id:row.id})
+            SET d.path        = row.path,
+                d.raw_content = row.raw_content
+            WITH d, row
+            UNWIND row.segments AS seg_data
+            MERGE (s:DocumentSegment {id:seg_data.seg_id})
+            SET s.text        = seg_data.text,
+                s.start_index = seg_data.start_index,
+                s.end_index   = seg_data.end_index,
+                s.page        = seg_data.page,
+                s.metadata    = seg_data.metadata,
+                s.public_url  = seg_data.public_url,
+                s.type        = seg_data.type
+            MERGE (d)-[:CONTAINS]->(s)
+            // Drop a stale vector when the segment no longer has an embedding
+            FOREACH (_ IN CASE WHEN seg_data.embedding IS NULL THEN [1] ELSE [] END |
+                REMOVE s.embedding)
+            // Store embeddings as native float32 vectors for the vector index
+            WITH s, seg_data
+            WHERE seg_data.embedding IS NOT NULL
+            CALL db.create.setNodeVectorProperty(s, 'embedding', seg_data.embedding)
+            """,
+            rows=document_rows,
+        ).consume()
+
+        # Link segments to the topics they mention, matching each Topic once per group
+        if mention_rows:
+            tx.run(
                 """
-                MERGE (d:Document {id:$id})
-                SET d.path        = $path,
-                    d.raw_content = $raw_content
+                UNWIND $rows AS grp
+                MATCH (t:Topic {id:grp.topic_id})
+                UNWIND grp.seg_ids AS seg_id
+                MATCH (s:DocumentSegment {id:seg_id})
+                MERGE (s)-[:MENTIONS]->(t)
                 """,
-                id=doc.id,
-                path=doc.path,
-                raw_content=doc.raw_content,
-            )
+                rows=mention_rows,
+            ).consume()
+
+    def _write_document_batch(self, session, docs: list[Document]) -> None:
+        # Group mentioning segment IDs by topic while building the document rows
+        seg_ids_by_topic: dict[int, list[str]] = {}
+        document_rows = [self._document_row(doc, seg_ids_by_topic) for doc in docs]
+        mention_rows = [
+            {"topic_id": topic_id, "seg_ids": seg_ids}
+            for topic_id, seg_ids in seg_ids_by_topic.items()
+        ]
+        session.execute_write(self._upsert_documents_tx, document_rows, mention_rows)
 
-            # Prepare segment data for bulk upsert
-            segments_data = []
-            for seg in doc.segments:
-                segments_data.append(
-                    {
-                        "seg_id": seg.id,
-                        "text": seg.text,
-                        "start_index": seg.start_index,
-                        "end_index": seg.end_index,
-                        "page": seg.page,
-                        "metadata": json.dumps(seg.metadata)
-                        if seg.metadata is not None
-                        else None,
-                        "embedding": seg.embedding.tolist()
-                        if seg.embedding is not None
-                        else None,
-                        "public_url": seg.public_url,
-                        "doc_id": doc.id,
-                        "type": seg.type,
-                    }
-                )
-
-            # Bulk upsert segments and link them to the document
-            if segments_data:
-                session.run(
-                    """
-                    UNWIND $segments_data AS seg_data
-                    MERGE (s:DocumentSegment {id:seg_data.seg_id})
-                    SET s.text        = seg_data.text,
-                        s.start_index = seg_data.start_index,
-                        s.end_index   = seg_data.end_index,
-                        s.page        = seg_data.page,
-                        s.metadata    = seg_data.metadata,
-                        s.embedding   = seg_data.embedding,
-                        s.public_url  = seg_data.public_url,
-                        s.type        = seg_data.type
-                    WITH s, seg_data
-                    MATCH (d:Document {id:seg_data.doc_id})
-                    MERGE (d)-[:CONTAINS]->(s)
-                    """,
-                    segments_data=segments_data,
-                )
-
-            # Prepare topic mentions for bulk upsert
-            topic_mentions_data = []
-            for seg in doc.segments:
-                if seg.topic_id is not None:
-                    topic_mentions_data.append(
-                        {
-                            "seg_id": seg.id,
-                            "topic_id": seg.topic_id,
-                        }
-                    )
-
-            # Bulk link segments to topics if they mention them
-            if topic_mentions_data:
-                session.run(
-                    """
-                    UNWIND $topic_mentions_data AS mention_data
-                    MATCH (s:DocumentSegment {id:mention_data.seg_id})
-                    MATCH (t:Topic {id:mention_data.topic_id})
-                    MERGE (s)-[:MENTIONS]->(t)
-                    """,
-                    topic_mentions_data=topic_mentions_data,
-                )
+    def upsert_documents(self, docs: list[Document], batch_size: int = 5000) -> None:
+        """
+        Upserts documents, their segments and the CONTAINS/MENTIONS relationships.
+        Documents are grouped into batches of roughly `batch_size` segments, and
+        each batch is written in a single managed write transaction, so every
+        document commits atomically together with its segments and relationships.
+        """
+        with self._session_scope() as session:
+            batch: list[Document] = []
+            batch_segments = 0
+            for doc in docs:
+                batch.append(doc)
+                batch_segments += len(doc.segments)
+                if batch_segments >= batch_size:
+                    self._write_document_batch(session, batch)
+                    batch, batch_segments = [], 0
+            if batch:
+                self._write_document_batch(session, batch)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     # adjust URI/credentials as needed
     mgr = SchemaManager("bolt://localhost:7687", "neo4j", "password")
     try:
-        # Example usage:
-        # To apply schema:
-        # mgr.apply_schema()
-        # print("Schema applied successfully.")
-
-        # To nuke the database (use with caution!):
-        # print("Attempting to nuke the database...")
-        # mgr.nuke_database()
-        # print("Database nuke attempt finished.")
-
-        # For regular schema application:
         mgr.apply_schema()
-        print("Schema applied successfully.")
+        logger.info("Schema applied successfully.")
     finally:
         mgr.close()
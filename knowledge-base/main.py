@@ -1,19 +1,29 @@
 from dotenv import load_dotenv
 
+import logging
+import logging.handlers
+import multiprocessing
 import os
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 import argparse
 import asyncio
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from tqdm import tqdm
 from tqdm.asyncio import tqdm as async_tqdm
 
 from graph import SchemaManager
 from model import Document, DocumentSegment, Topic
-from parser import parse_document
+from parser import (
+    parse_document,
+    parse_document_cached,
+    parse_cache_dir_for,
+    prune_parse_cache,
+)
 from util.errors import NoSuchDocumentError
 from analysis.embedding import EmbeddingClient
+from analysis.embedding_cache import EmbeddingCache
 from analysis.topic_modeling import extract_topics, topics_to_pydantic
 from model.store import (
     store_documents_as_json,
@@ -25,6 +35,8 @@ from model.store import (
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Project root directory
 PROJECT_ROOT_DIR = Path(__file__).parent.parent
 DOCUMENTS_BASE_DIR_ABS = Path(__file__).parent / "documents"
@@ -32,67 +44,176 @@ STRUCTURED_KB_OUTPUT_DIR = Path(__file__).parent / "structured-knowledge-base"
 STRUCTURED_DOCS_OUTPUT_DIR = (
     Path(__file__).parent / "structured-knowledge-base" / "documents"
 )
+# Add more extensions here if needed, e.g., ".txt", ".docx"
+SUPPORTED_EXTENSIONS = frozenset({".pdf", ".json"})
+EMBEDDING_CACHE_PATH = STRUCTURED_KB_OUTPUT_DIR / "embedding-cache.sqlite"
+# Maximum number of document JSON writes in flight while embedding
+STORE_CONCURRENCY = 8
+UMAP_CACHE_DIR = STRUCTURED_KB_OUTPUT_DIR / "umap-cache"
+PARSE_CACHE_DIR = STRUCTURED_KB_OUTPUT_DIR / "parse-cache"
+
+
+def _init_worker_logging(log_queue: multiprocessing.Queue, level: int) -> None:
+    """
+    Routes log records of a parse worker process through `log_queue`, so the
+    parent's QueueListener is the only writer to the console.
+    """
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(level)
+
+
+def _file_size(path: str) -> int:
+    """Returns the size of the file at `path`, or 0 if it can't be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _parse_one(
+    doc_path_abs: str,
+    document_id: str,
+    doc_path_rel: str,
+    parse_cache_dir: Path | None = None,
+) -> Document:
+    """
+    Parses a single document in a worker process and returns it with its path
+    set to `doc_path_rel`, the path relative to the project root.
+    If `parse_cache_dir` is given, unchanged documents are loaded from the parse
+    cache there instead of being parsed again.
+    """
+    # Parse document using its absolute path for reading
+    if parse_cache_dir is None:
+        document_obj = parse_document(doc_path_abs, document_id)
+    else:
+        document_obj = parse_document_cached(doc_path_abs, document_id, parse_cache_dir)
+    # Update the path in the Document object
+    document_obj.path = doc_path_rel
+    return document_obj
 
 
-def load_and_parse_documents(
+def iter_and_parse_documents(
     documents_dir_abs: Path = DOCUMENTS_BASE_DIR_ABS,
     project_root: Path = PROJECT_ROOT_DIR,
-) -> List[Document]:
+    parse_cache_dir: Path | None = None,
+) -> Iterator[Document]:
     """
-    Scans a directory for documents, parses them, and returns a list of Document objects
-    with paths relative to the project root.
+    Scans a directory for documents, parses them, and yields Document objects
+    with paths relative to the project root as soon as each one is parsed, so
+    callers can persist and release documents one at a time.
 
     Supported file types are those handled by the `parse_document` function (e.g., .pdf, .txt).
-    Uses tqdm to display a progress bar.
+    Documents are parsed in parallel across CPU cores and are yielded in completion
+    order; uses tqdm to display a progress bar.
 
     Args:
         documents_dir_abs: The directory to scan for documents.
         project_root: The project root directory for making paths relative.
+        parse_cache_dir: Optional root directory of the parse cache. Documents
+            under `documents_dir_abs` are cached in a subdirectory of their own,
+            keyed on file path, mtime and size; entries of files that changed or
+            are no longer found are pruned before parsing.
 
-    Returns:
-        A list of Document objects.
+    Yields:
+        Parsed Document objects.
     """
-    doc_paths_abs: List[Path] = []
-    # Recursively find all files in the documents_dir
-    # Add more extensions here if needed, e.g., "*.txt", "*.docx"
-    supported_extensions = ["*.pdf", "*.json"]
-    for ext in supported_extensions:
-        doc_paths_abs.extend(list(documents_dir_abs.rglob(ext)))
-
-    # Remove everything in /voting/ for now
-    doc_paths_abs = [
-        path for path in doc_paths_abs if "voting" not in str(path).lower()
-    ]
+    doc_paths_abs: List[str] = []
+    doc_paths_rel: List[str] = []
+    # Sizes are recorded during discovery to order parsing; files that vanish
+    # afterwards are reported when their parse fails
+    doc_sizes: List[int] = []
+    # Paths are made relative to the project root by slicing off this prefix, once
+    # per directory, instead of calling Path.relative_to for every file
+    root_prefix = os.path.join(os.fspath(project_root), "")
+    # Recursively find all supported files in the documents_dir in a single walk
+    for dirpath, dirnames, filenames in os.walk(documents_dir_abs):
+        # Remove everything in /voting/ for now; pruning here skips walking it at all
+        dirnames[:] = sorted(d for d in dirnames if "voting" not in d.lower())
+        if dirpath.startswith(root_prefix):
+            dirpath_rel = dirpath[len(root_prefix) :]
+        else:
+            dirpath_rel = str(Path(dirpath).relative_to(project_root))
+        for filename in sorted(filenames):
+            if (
+                os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS
+                and "voting" not in filename.lower()
+            ):
+                doc_path_abs = os.path.join(dirpath, filename)
+                doc_paths_abs.append(doc_path_abs)
+                doc_sizes.append(_file_size(doc_path_abs))
+                doc_paths_rel.append(os.path.join(dirpath_rel, filename))
 
     if not doc_paths_abs:
-        print(
-            f"No documents found in {documents_dir_abs} with extensions: {supported_extensions}"
+        logger.info(
+            "No documents found in %s with extensions: %s",
+            documents_dir_abs,
+            sorted(SUPPORTED_EXTENSIONS),
         )
-        return []
-
-    parsed_documents: List[Document] = []
-    print(f"Found {len(doc_paths_abs)} documents. Starting parsing...")
-
-    for i, doc_path_abs in enumerate(
-        tqdm(doc_paths_abs, desc="Parsing documents", unit="doc")
-    ):
-        try:
-            # Parse document using its absolute path for reading
-            document_obj = parse_document(str(doc_path_abs), str(i))
-
-            relative_path = doc_path_abs.relative_to(project_root)
-            document_obj.path = str(
-                relative_path
-            )  # Update the path in the Document object
-
-            parsed_documents.append(document_obj)
-        except NoSuchDocumentError as e:
-            print(f"Skipping (not found): {doc_path_abs}. Error: {e}")
-
-    print(
-        f"Successfully parsed {len(parsed_documents)} out of {len(doc_paths_abs)} documents."
+        return
+
+    logger.info("Found %d documents. Starting parsing...", len(doc_paths_abs))
+    if parse_cache_dir is not None:
+        parse_cache_dir = parse_cache_dir_for(parse_cache_dir, documents_dir_abs)
+        pruned_count = prune_parse_cache(parse_cache_dir, doc_paths_abs)
+        if pruned_count:
+            logger.info("Pruned %d stale parse cache entries.", pruned_count)
+
+    # Parsing is CPU-bound, so documents are parsed in parallel worker processes.
+    parsed_count = 0
+    root_logger = logging.getLogger()
+    log_queue = multiprocessing.Queue()
+    log_listener = logging.handlers.QueueListener(
+        log_queue, *root_logger.handlers, respect_handler_level=True
+    )
+    log_listener.start()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            initializer=_init_worker_logging,
+            initargs=(log_queue, root_logger.level),
+        ) as executor:
+            # Largest files are submitted first, so a big PDF never starts last
+            # and leaves the other workers idle while it finishes; document IDs
+            # still follow discovery order
+            submission_order = sorted(
+                range(len(doc_paths_abs)),
+                key=doc_sizes.__getitem__,
+                reverse=True,
+            )
+            futures = {
+                executor.submit(
+                    _parse_one,
+                    doc_paths_abs[i],
+                    str(i),
+                    doc_paths_rel[i],
+                    parse_cache_dir,
+                ): i
+                for i in submission_order
+            }
+            for future in tqdm(
+                as_completed(futures),
+                total=len(futures),
+                desc="Parsing documents",
+                unit="doc",
+            ):
+                # Drop our reference so the parsed document can be freed once consumed
+                i = futures.pop(future)
+                try:
+                    document_obj = future.result()
+                except NoSuchDocumentError as e:
+                    logger.warning(
+                        "Skipping (not found): %s. Error: %s", doc_paths_abs[i], e
+                    )
+                    continue
+                parsed_count += 1
+                yield document_obj
+    finally:
+        log_listener.stop()
+
+    logger.info(
+        "Successfully parsed %d out of %d documents.", parsed_count, len(doc_paths_abs)
     )
-    return parsed_documents
 
 
 async def main():
@@ -117,10 +238,25 @@ async def main():
         default=str(STRUCTURED_DOCS_OUTPUT_DIR),
         help=f"Directory to store/load structured JSON documents. Default: {STRUCTURED_DOCS_OUTPUT_DIR}",
     )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Embed through the OpenAI Batch API (half price, but may take up to 24h) instead of the realtime endpoint.",
+    )
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help=f"Parse every document again instead of reusing unchanged ones from {PARSE_CACHE_DIR}.",
+    )
     # Add more arguments as needed, e.g., for embedding model selection
 
     args = parser.parse_args()
 
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+
     documents: List[Document] = []
     topics: List[Topic] = []
     processed_something = False
@@ -131,12 +267,18 @@ async def main():
 
     if "parse" in args.actions:
         print(f"Starting document parsing from: {docs_dir_abs}...")
-        documents = load_and_parse_documents(
-            documents_dir_abs=docs_dir_abs, project_root=PROJECT_ROOT_DIR
-        )
-        print(f"Successfully parsed {len(documents)} documents.")
         print(f"Storing parsed documents to {structured_output_dir}...")
-        store_documents_as_json(documents, structured_output_dir)
+        # Each document is written as soon as it is parsed and then released;
+        # later actions reload the documents from disk
+        stored_count = 0
+        for doc in iter_and_parse_documents(
+            documents_dir_abs=docs_dir_abs,
+            project_root=PROJECT_ROOT_DIR,
+            parse_cache_dir=None if args.no_parse_cache else PARSE_CACHE_DIR,
+        ):
+            store_document_as_json(doc, structured_output_dir)
+            stored_count += 1
+        print(f"Successfully parsed and stored {stored_count} documents.")
         processed_something = True
 
     if "embed" in args.actions:
@@ -150,21 +292,47 @@ async def main():
                 return
 
         print(f"Starting embedding for {len(documents)} documents...")
-        embedding_client = EmbeddingClient()
-        processed_docs_count = 0
-        # Wrap the documents list with tqdm for a top-level progress bar
-        async for doc in async_tqdm(
-            embedding_client.embed_documents(documents),
-            total=len(documents),
-            desc="Embedding and Storing Documents",
-        ):
-            store_document_as_json(doc, structured_output_dir)
-            processed_docs_count += 1
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+        embedding_client = EmbeddingClient(cache=embedding_cache)
+        if args.batch_api:
+            documents = await embedding_client.embed_documents_batch_api(documents)
+            store_documents_as_json(documents, structured_output_dir)
+            print(
+                f"Successfully embedded and stored {len(documents)} documents via the Batch API."
+            )
+        else:
+            processed_docs_count = 0
+            # Disk writes run in worker threads so storing a document overlaps with
+            # the embedding requests still in flight; at most STORE_CONCURRENCY
+            # writes are pending at any time
+            pending_stores: set[asyncio.Task] = set()
+            # Wrap the documents list with tqdm for a top-level progress bar
+            async for doc in async_tqdm(
+                embedding_client.embed_documents(documents),
+                total=len(documents),
+                desc="Embedding and Storing Documents",
+            ):
+                if len(pending_stores) >= STORE_CONCURRENCY:
+                    done, pending_stores = await asyncio.wait(
+                        pending_stores, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+                pending_stores.add(
+                    asyncio.create_task(
+                        asyncio.to_thread(
+                            store_document_as_json, doc, structured_output_dir
+                        )
+                    )
+                )
+                processed_docs_count += 1
+            await asyncio.gather(*pending_stores)
 
-        print(
-            f"Successfully embedded and stored {processed_docs_count} documents incrementally."
-        )
-        # No need to store all documents again at the end, as it's done incrementally
+            print(
+                f"Successfully embedded and stored {processed_docs_count} documents incrementally."
+            )
+            # No need to store all documents again at the end, as it's done incrementally
+        embedding_cache.close()
         processed_something = True
 
     if "topicmodel" in args.actions:
@@ -195,7 +363,7 @@ async def main():
         )
         # extract_topics modifies segments in-place by adding topic_id
         topic_model_bertopic, segment_topic_map = extract_topics(
-            all_segments
+            all_segments, n_process=-1, reduction_cache_dir=UMAP_CACHE_DIR
         )  # Pass only segments with embeddings
 
         topics = topics_to_pydantic(topic_model_bertopic)
@@ -206,18 +374,25 @@ async def main():
         else:
             print("No topics were generated (excluding outliers).")
 
-        # After topic IDs are assigned to segments, documents need to be re-saved
+        # After topic IDs are assigned to segments, documents need to be re-saved;
+        # documents whose topic IDs didn't change are not rewritten
         print(
             f"Assigning topic IDs to segments and storing updated documents back to {structured_output_dir}..."
         )
         updated_doc_count = 0
         for doc in tqdm(documents, desc="Storing Documents with Topics", unit="doc"):
+            changed = False
             for segment in doc.segments:
-                if segment.id in segment_topic_map:
-                    segment.topic_id = segment_topic_map[segment.id]
-            store_document_as_json(doc, structured_output_dir)
-            updated_doc_count += 1
-        print(f"Successfully stored {updated_doc_count} documents with topic IDs.")
+                topic_id = segment_topic_map.get(segment.id, segment.topic_id)
+                if topic_id != segment.topic_id:
+                    segment.topic_id = topic_id
+                    changed = True
+            if changed:
+                store_document_as_json(doc, structured_output_dir)
+                updated_doc_count += 1
+        print(
+            f"Successfully stored {updated_doc_count} of {len(documents)} documents with changed topic IDs."
+        )
         processed_something = True
 
     if "graph" in args.actions:
@@ -230,33 +405,34 @@ async def main():
             documents = load_documents_from_json(structured_output_dir)
 
         print("Starting graph operations...")
-        schema_manager = SchemaManager(
+        with SchemaManager(
             uri=os.getenv("NEO4J_URI"),
             user=os.getenv("NEO4J_USERNAME"),
             password=os.getenv("NEO4J_PASSWORD"),
-        )
-        schema_manager.clear_database()
-        schema_manager.apply_schema()
-        print("Schema applied successfully.")
+        ) as schema_manager:
+            schema_manager.clear_database()
+            schema_manager.apply_constraints()
+            print("Constraints applied successfully.")
 
-        print("Upserting topics...")
-        for topic in tqdm(topics, desc="Upserting topics", unit="topic"):
-            schema_manager.upsert_topic(topic)
-        print("Topics upserted successfully.")
+            print(f"Upserting {len(topics)} topics...")
+            schema_manager.upsert_topics(topics)
+            print("Topics upserted successfully.")
 
-        print("Upserting documents...")
-        for doc in tqdm(documents, desc="Upserting documents", unit="doc"):
-            schema_manager.upsert_document(doc)
-        print("Documents upserted successfully.")
+            print(f"Upserting {len(documents)} documents...")
+            schema_manager.upsert_documents(documents)
+            print("Documents upserted successfully.")
+
+            schema_manager.apply_vector_indexes()
+            print("Vector indexes built successfully.")
 
     if "graph-clear" in args.actions:
-        schema_manager = SchemaManager(
+        with SchemaManager(
             uri=os.getenv("NEO4J_URI"),
             user=os.getenv("NEO4J_USERNAME"),
             password=os.getenv("NEO4J_PASSWORD"),
-        )
-        print("Starting graph operations...")
-        schema_manager.clear_database()
+        ) as schema_manager:
+            print("Starting graph operations...")
+            schema_manager.clear_database()
 
     if not processed_something:
         print(
@@ -1,32 +1,74 @@
-from pydantic import BaseModel, field_serializer, field_validator
+from pydantic import BaseModel, Field, field_serializer, field_validator
+import base64
 import numpy as np
 from typing import Any
 
+# dtype of every embedding, in memory and on disk; matches the Neo4j vector index
+# and is half of float64
+EMBEDDING_DTYPE = np.float32
 
-class Topic(BaseModel):
-    id: int
-    name: str
-    description: str
-    embedding: np.ndarray | None = None
+
+def embedding_to_json(v: np.ndarray) -> dict[str, str]:
+    """
+    Encodes an embedding as base64 float32 bytes for JSON, e.g. {"__np__": "..."}.
+    This is roughly a quarter of the size of a list of floats rendered as text.
+    """
+    raw = np.ascontiguousarray(v, dtype=EMBEDDING_DTYPE).tobytes()
+    return {"__np__": base64.b64encode(raw).decode("ascii")}
+
+
+def embedding_from_json(v: Any) -> Any:
+    """
+    Decodes an embedding written by `embedding_to_json`, a bare base64 string of
+    float32 bytes, or raw float32 bytes; each is a single memcpy rather than a
+    per-float conversion.
+    Plain lists (the previous JSON format) and arrays are coerced to float32;
+    anything else is returned unchanged for Pydantic to validate.
+    """
+    if isinstance(v, dict) and "__np__" in v:
+        v = v["__np__"]
+    if isinstance(v, str):
+        # The decoded bytes are owned by the array alone, so no copy is needed
+        return np.frombuffer(base64.b64decode(v), dtype=EMBEDDING_DTYPE)
+    if isinstance(v, (bytes, bytearray)):
+        # Copy so the embedding doesn't alias the caller's buffer
+        return np.frombuffer(v, dtype=EMBEDDING_DTYPE).copy()
+    if isinstance(v, (list, np.ndarray)):
+        return np.asarray(v, dtype=EMBEDDING_DTYPE)
+    return v
+
+
+class EmbeddingMixin(BaseModel):
+    """
+    Shared JSON (de)serialization for models with an `embedding: np.ndarray | None`
+    field. Subclasses declare the field themselves, so it keeps its position.
+    """
 
     model_config = {"arbitrary_types_allowed": True}
 
-    @field_serializer("embedding", when_used="json")
-    def serialize_embedding_to_list(self, v: np.ndarray) -> list[float]:
-        """Convert np.ndarray to list for JSON serialization."""
+    @field_serializer("embedding", when_used="json", check_fields=False)
+    def serialize_embedding(self, v: np.ndarray) -> dict[str, str] | None:
+        """Convert np.ndarray to base64 float32 bytes for JSON serialization."""
         if v is None:
             return None
-        return v.tolist()
+        return embedding_to_json(v)
 
-    @field_validator("embedding", mode="before")
+    @field_validator("embedding", mode="before", check_fields=False)
     @classmethod
     def validate_embedding(cls, v: Any) -> np.ndarray | None:
-        if isinstance(v, list):
-            return np.array(v, dtype=float)
-        return v
+        """Convert base64 bytes or a list to np.ndarray during deserialization from JSON."""
+        # If v is None, Pydantic's default validation will handle it.
+        return embedding_from_json(v)
 
 
-class DocumentSegment(BaseModel):
+class Topic(EmbeddingMixin):
+    id: int
+    name: str
+    description: str
+    embedding: np.ndarray | None = None
+
+
+class DocumentSegment(EmbeddingMixin):
     id: str
     text: str
     start_index: int
@@ -37,25 +79,9 @@ class DocumentSegment(BaseModel):
     topic_id: int | None = None
     type: str | None = None
     public_url: str | None = None
-
-    model_config = {"arbitrary_types_allowed": True}
-
-    @field_serializer("embedding", when_used="json")
-    def serialize_embedding_to_list(self, v: np.ndarray) -> list[float]:
-        """Convert np.ndarray to list for JSON serialization."""
-        if v is None:
-            return None
-        return v.tolist()
-
-    @field_validator("embedding", mode="before")
-    @classmethod
-    def validate_embedding_from_list(cls, v: Any) -> np.ndarray | None:
-        """Convert list to np.ndarray during deserialization from JSON."""
-        if isinstance(v, list):
-            return np.array(v, dtype=float)
-        # If v is None, or already an np.ndarray (e.g. direct model instantiation),
-        # Pydantic's default validation will handle it.
-        return v
+    # Row of this segment's embedding in the owning Document's embedding_matrix,
+    # and in the document's .npy embedding sidecar on disk
+    embedding_row: int | None = None
 
 
 class Document(BaseModel):
@@ -63,3 +89,43 @@ class Document(BaseModel):
     path: str
     raw_content: str
     segments: list[DocumentSegment]
+    # Contiguous (n_embedded_segments, dim) matrix holding all segment embeddings
+    embedding_matrix: np.ndarray | None = Field(default=None, exclude=True)
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def pack_embeddings(self) -> None:
+        """
+        Packs all segment embeddings into a single contiguous EMBEDDING_DTYPE matrix.
+        Each segment's embedding is replaced by a row view into the matrix, so the
+        per-segment arrays no longer hold their own allocations.
+        """
+        embedded_segments = [
+            seg
+            for seg in self.segments
+            if seg.embedding is not None and seg.embedding.size > 0
+        ]
+        if not embedded_segments:
+            self.embedding_matrix = None
+            return
+
+        dim = embedded_segments[0].embedding.shape[0]
+        matrix = np.empty((len(embedded_segments), dim), dtype=EMBEDDING_DTYPE)
+        for row, seg in enumerate(embedded_segments):
+            matrix[row] = seg.embedding
+            seg.embedding = matrix[row]
+            seg.embedding_row = row
+        self.embedding_matrix = matrix
+
+    def attach_embeddings(self, matrix: np.ndarray) -> None:
+        """
+        Uses `matrix` (e.g. a memory-mapped .npy sidecar) as the embedding matrix,
+        pointing each segment's embedding at its `embedding_row` without copying.
+        For a memory map, rows are paged in from disk only when read; the segment
+        views keep the mapping alive through `.base`, and are read-only when the
+        file was opened with mmap_mode="r".
+        """
+        for seg in self.segments:
+            if seg.embedding_row is not None:
+                seg.embedding = matrix[seg.embedding_row]
+        self.embedding_matrix = matrix
@@ -1,17 +1,96 @@
-import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from typing import List
+import numpy as np
+from pydantic import TypeAdapter
 from tqdm import tqdm
 
 from . import (
+    EMBEDDING_DTYPE,
     Document,
     Topic,
 )  # Assuming Document and Topic are in __init__.py in the same package
 
+# Serializes documents straight to UTF-8 bytes, skipping the str round trip
+_DOCUMENT_ADAPTER = TypeAdapter(Document)
+# Validates/serializes a whole topics file in one call
+_TOPICS_ADAPTER = TypeAdapter(List[Topic])
+# Segment embeddings live in the .npy sidecar, not in the document JSON
+_EXCLUDE_SEGMENT_EMBEDDINGS = {"segments": {"__all__": {"embedding"}}}
+
+
+def _write_bytes(path: str | Path, data: bytes) -> None:
+    """Writes already-encoded bytes with raw os.write calls, bypassing Python's file buffering."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+def _read_document(json_file_path: str) -> Document:
+    """Reads a document written by `_write_document`, attaching its embeddings."""
+    # Parse and validate straight from the raw bytes, without building an
+    # intermediate dict
+    with open(json_file_path, "rb") as f:
+        document = Document.model_validate_json(f.read())
+    sidecar_filepath = os.path.splitext(json_file_path)[0] + ".npy"
+    if os.path.exists(sidecar_filepath):
+        document.attach_embeddings(np.load(sidecar_filepath, mmap_mode="r"))
+    else:
+        document.pack_embeddings()
+    return document
+
+
+def _write_document(document: Document, output_dir: Path) -> None:
+    """
+    Writes a document as `<stem>.json` plus its segment embeddings, stacked into a
+    float32 matrix, as `<stem>.npy`. Each segment's `embedding_row` records its row.
+    """
+    # Plain string operations instead of pathlib, as this runs once per document
+    stem = os.path.splitext(os.path.basename(document.path))[0]
+    output_filepath = os.path.join(os.fspath(output_dir), stem + ".json")
+    sidecar_filepath = os.path.join(os.fspath(output_dir), stem + ".npy")
+
+    rows: list[np.ndarray] = []
+    for seg in document.segments:
+        if seg.embedding is not None and seg.embedding.size > 0:
+            seg.embedding_row = len(rows)
+            rows.append(seg.embedding)
+        else:
+            seg.embedding_row = None
+
+    if rows:
+        # The sidecar may be memory-mapped by the loaded document being written, so it
+        # is replaced with a new file rather than truncated in place
+        tmp_filepath = sidecar_filepath + ".tmp"
+        # Rows are copied once into a contiguous float32 matrix, which np.load can
+        # memory-map directly
+        matrix = np.empty((len(rows), rows[0].shape[0]), dtype=EMBEDDING_DTYPE)
+        for row, embedding in enumerate(rows):
+            matrix[row] = embedding
+        with open(tmp_filepath, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_filepath, sidecar_filepath)
+    elif os.path.exists(sidecar_filepath):
+        os.remove(sidecar_filepath)
+
+    _write_bytes(
+        output_filepath,
+        _DOCUMENT_ADAPTER.dump_json(
+            document, indent=2, exclude=_EXCLUDE_SEGMENT_EMBEDDINGS
+        ),
+    )
+
 
 def store_documents_as_json(documents: List[Document], output_dir: Path):
     """
-    Serializes a list of Document objects to pretty-printed JSON files.
+    Serializes a list of Document objects to pretty-printed JSON files, with
+    segment embeddings in a .npy sidecar next to each file.
     Each document's path attribute is assumed to be relative to the project root.
 
     Args:
@@ -25,23 +104,23 @@ def store_documents_as_json(documents: List[Document], output_dir: Path):
     output_dir.mkdir(parents=True, exist_ok=True)
     print(f"Storing {len(documents)} documents as JSON in {output_dir}...")
 
-    for doc in tqdm(documents, desc="Storing JSON documents", unit="doc"):
-        original_path = Path(doc.path)
-        # Use a consistent naming convention, e.g., based on the original stem
-        # and potentially adding a suffix if it's an intermediate or final version.
-        json_filename = original_path.stem + ".json"
-        output_filepath = output_dir / json_filename
-        # Pydantic's model_dump_json handles np.ndarray by converting to list
-        json_string = doc.model_dump_json(indent=2)
-        with open(output_filepath, "w", encoding="utf-8") as f:
-            f.write(json_string)
+    # Documents are written from a thread pool so file I/O overlaps across files
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for _ in tqdm(
+            executor.map(partial(_write_document, output_dir=output_dir), documents),
+            total=len(documents),
+            desc="Storing JSON documents",
+            unit="doc",
+        ):
+            pass
 
     print(f"Successfully stored documents in {output_dir}.")
 
 
 def store_document_as_json(document: Document, output_dir: Path):
     """
-    Serializes a single Document object to a pretty-printed JSON file.
+    Serializes a single Document object to a pretty-printed JSON file, with
+    segment embeddings in a .npy sidecar next to it.
     The document's path attribute is assumed to be relative to the project root.
 
     Args:
@@ -49,19 +128,14 @@ def store_document_as_json(document: Document, output_dir: Path):
         output_dir: The directory where the JSON file will be stored.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
-    original_path = Path(document.path)
-    json_filename = original_path.stem + ".json"
-    output_filepath = output_dir / json_filename
-
-    # Pydantic's model_dump_json handles np.ndarray by converting to list
-    json_string = document.model_dump_json(indent=2)
-    with open(output_filepath, "w", encoding="utf-8") as f:
-        f.write(json_string)
+    _write_document(document, output_dir)
 
 
 def load_documents_from_json(input_dir: Path) -> List[Document]:
     """
     Loads Document objects from JSON files in a specified directory.
+    Embeddings are memory-mapped from each file's .npy sidecar; files written
+    before sidecars existed carry their embeddings inline and are packed instead.
 
     Args:
         input_dir: The directory to scan for JSON files.
@@ -69,21 +143,35 @@ def load_documents_from_json(input_dir: Path) -> List[Document]:
     Returns:
         A list of loaded Document objects.
     """
-    json_files = list(input_dir.glob("*.json"))
+    # scandir reuses the directory entries' type information and yields plain
+    # string paths, instead of building a Path object per file
+    json_files: List[str] = []
+    if input_dir.is_dir():
+        with os.scandir(input_dir) as entries:
+            json_files = [
+                entry.path
+                for entry in entries
+                if entry.name.endswith(".json") and entry.is_file()
+            ]
+        # scandir order is arbitrary; sort so documents load in a stable order
+        json_files.sort()
     if not json_files:
         print(f"No JSON files found in {input_dir}.")
         return []
 
-    loaded_documents: List[Document] = []
     print(f"Loading {len(json_files)} documents from JSON in {input_dir}...")
 
-    for json_file_path in tqdm(json_files, desc="Loading JSON documents", unit="doc"):
-        with open(json_file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            # Pydantic will attempt to convert list back to np.ndarray for 'embedding'
-            # if DocumentSegment's embedding field is type-hinted as np.ndarray
-            document_obj = Document(**data)
-            loaded_documents.append(document_obj)
+    # Files are read from a thread pool so file I/O overlaps; map preserves the
+    # sorted file-name order
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        loaded_documents: List[Document] = list(
+            tqdm(
+                executor.map(_read_document, json_files),
+                total=len(json_files),
+                desc="Loading JSON documents",
+                unit="doc",
+            )
+        )
 
     print(f"Successfully loaded {len(loaded_documents)} documents from {input_dir}.")
     return loaded_documents
@@ -107,10 +195,8 @@ def store_topics_as_json(
     output_dir.mkdir(parents=True, exist_ok=True)
     output_filepath = output_dir / filename
 
-    # Convert list of Pydantic models to a list of dicts, then dump to JSON
-    topics_data = [topic.model_dump(mode="json") for topic in topics]
-    with open(output_filepath, "w", encoding="utf-8") as f:
-        json.dump(topics_data, f, indent=2, ensure_ascii=False)
+    # Serialize the whole list to JSON in one call
+    _write_bytes(output_filepath, _TOPICS_ADAPTER.dump_json(topics, indent=2))
     print(f"Successfully stored {len(topics)} topics in {output_filepath}.")
 
 
@@ -132,15 +218,10 @@ def load_topics_from_json(
         print(f"Topics file not found: {input_filepath}")
         return []
 
-    loaded_topics: List[Topic] = []
     print(f"Loading topics from {input_filepath}...")
 
-    with open(input_filepath, "r", encoding="utf-8") as f:
-        topics_data = json.load(f)
-        for topic_data in tqdm(topics_data, desc="Loading JSON topics", unit="topic"):
-            # Pydantic will use field_validator for 'embedding' to convert list to np.ndarray
-            topic_obj = Topic(**topic_data)
-            loaded_topics.append(topic_obj)
+    # Pydantic will use field_validator for 'embedding' to decode it to np.ndarray
+    loaded_topics = _TOPICS_ADAPTER.validate_json(input_filepath.read_bytes())
 
     print(f"Successfully loaded {len(loaded_topics)} topics from {input_filepath}.")
     return loaded_topics
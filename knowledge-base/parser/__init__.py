@@ -2,8 +2,16 @@ from model import Document
 from .pdf_parser import parse_pdf
 from .json_website_parser import parse_json
 from util.errors import NoSuchDocumentError
+from hashlib import blake2b
+from pathlib import Path
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# Part of every parse cache key; bump it whenever a parser change alters its output
+PARSE_CACHE_VERSION = 1
+
 
 def parse_document(path: str, document_id: str) -> Document:
     raw_content: str = ""
@@ -24,11 +32,111 @@ def parse_document(path: str, document_id: str) -> Document:
             raise
 
     else:
-        print(
-            f"Unsupported file type: {file_extension} for document {document_id} at {path}"
+        logger.warning(
+            "Unsupported file type: %s for document %s at %s",
+            file_extension,
+            document_id,
+            path,
         )
         return Document(id=document_id, path=path, raw_content="", segments=[])
 
     return Document(
         id=document_id, path=path, raw_content=raw_content, segments=segments
     )
+
+
+def _parse_cache_key(path: str) -> str:
+    """
+    Identifies the current contents of the file at `path` by its absolute path,
+    mtime and size, together with PARSE_CACHE_VERSION.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise NoSuchDocumentError(f"File not found: {path}")
+    key_parts = (
+        PARSE_CACHE_VERSION,
+        os.path.abspath(path),
+        stat.st_mtime_ns,
+        stat.st_size,
+    )
+    return blake2b(
+        "\0".join(map(str, key_parts)).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def parse_document_cached(path: str, document_id: str, cache_dir: Path) -> Document:
+    """
+    Like `parse_document`, but caches the parsed Document as JSON in `cache_dir`,
+    keyed on the file's identity (see `_parse_cache_key`). Re-runs over unchanged
+    files skip parsing entirely; a modified file gets a new key, so stale entries
+    are never read.
+    Document IDs are not part of the key: on a hit, the document and segment IDs
+    are rewritten to `document_id`, so newly discovered files don't invalidate the
+    entries of the files after them.
+    """
+    cache_path = cache_dir / f"{_parse_cache_key(path)}.json"
+    try:
+        with open(cache_path, "rb") as f:
+            document = Document.model_validate_json(f.read())
+    except FileNotFoundError:
+        pass
+    else:
+        # Segment IDs are "<document id>-<n>", see the parsers
+        segment_id_prefix = f"{document.id}-"
+        for segment in document.segments:
+            if not segment.id.startswith(segment_id_prefix):
+                raise ValueError(
+                    f"Cached segment {segment.id} of {path} doesn't belong to document {document.id}"
+                )
+            segment.id = f"{document_id}-{segment.id[len(segment_id_prefix) :]}"
+        document.id = document_id
+        document.path = path
+        return document
+
+    document = parse_document(path, document_id)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Parse workers write concurrently, so entries are renamed into place whole
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(document.model_dump_json().encode("utf-8"))
+    os.replace(tmp_path, cache_path)
+    return document
+
+
+def parse_cache_dir_for(cache_root: Path, documents_dir: Path | str) -> Path:
+    """
+    Returns the parse cache directory under `cache_root` for the documents in
+    `documents_dir`. Each documents root gets its own directory, so pruning the
+    cache of one root never deletes the entries of another.
+    """
+    root_key = blake2b(
+        os.path.abspath(documents_dir).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return cache_root / root_key
+
+
+def prune_parse_cache(cache_dir: Path, paths: list[str]) -> int:
+    """
+    Deletes every entry in `cache_dir` that doesn't belong to the current contents
+    of one of `paths`, e.g. entries of modified or removed files. Files that are
+    gone by the time the cache is pruned simply have no live entry, and temporary
+    files of in-progress writes are left alone.
+    Returns the number of deleted entries.
+    """
+    if not cache_dir.is_dir():
+        return 0
+    live_names = set()
+    for path in paths:
+        try:
+            live_names.add(f"{_parse_cache_key(path)}.json")
+        except NoSuchDocumentError:
+            continue
+    deleted = 0
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".tmp"):
+                continue
+            if entry.name not in live_names:
+                os.unlink(entry.path)
+                deleted += 1
+    return deleted
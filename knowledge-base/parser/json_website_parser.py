@@ -1,7 +1,12 @@
 import json
+import logging
 from model import DocumentSegment
 from util.errors import NoSuchDocumentError
 
+logger = logging.getLogger(__name__)
+
+RAW_CONTENT_SEPARATOR = "\n\n"
+
 
 def parse_json(path: str, document_id: str) -> tuple[str, list[DocumentSegment]]:
     """
@@ -17,11 +22,11 @@ def parse_json(path: str, document_id: str) -> tuple[str, list[DocumentSegment]]
         raise NoSuchDocumentError(f"File not found: {path}")
     except json.JSONDecodeError:
         # Or a more specific error, or allow it to propagate if that's preferred by project standards
-        print(f"Error decoding JSON from file: {path}")
+        logger.warning("Error decoding JSON from file: %s", path)
         return "", []
 
     if not isinstance(data, list):
-        print(f"JSON data in {path} is not a list as expected.")
+        logger.warning("JSON data in %s is not a list as expected.", path)
         return "", []
 
     raw_parts = []
@@ -30,20 +35,16 @@ def parse_json(path: str, document_id: str) -> tuple[str, list[DocumentSegment]]
 
     for i, item in enumerate(data):
         if not isinstance(item, dict) or "content" not in item or "url" not in item:
-            print(f"Skipping invalid item at index {i} in {path}: {item}")
+            logger.debug("Skipping invalid item at index %d in %s: %s", i, path, item)
             continue
 
         content = item.get("content", "")
         url = item.get("url", "")
 
-        # Add to raw_parts for later concatenation
+        if raw_parts:
+            current_char_offset += len(RAW_CONTENT_SEPARATOR)
         raw_parts.append(content)
 
-        # Calculate start and end index for the segment based on future raw_content
-        # This will be done after all parts are collected.
-        # For now, placeholder values, or calculate based on current_char_offset
-        # which is simpler for now.
-
         start_index = current_char_offset
         end_index = current_char_offset + len(content)
 
@@ -59,10 +60,8 @@ def parse_json(path: str, document_id: str) -> tuple[str, list[DocumentSegment]]
                 public_url=url,
             )
         )
-        current_char_offset += len(content)
-        if i < len(data) - 1:  # Add separator length if not the last item
-            current_char_offset += 2  # For "\\n\\n" separator
+        current_char_offset = end_index
 
-    raw_content = "\\n\\n".join(raw_parts)
+    raw_content = RAW_CONTENT_SEPARATOR.join(raw_parts)
 
     return raw_content, segments
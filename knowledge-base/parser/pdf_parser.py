@@ -1,14 +1,55 @@
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from model import DocumentSegment
-import pdfplumber
+from util.errors import NoSuchDocumentError
+import pypdfium2 as pdfium
+import bisect
+import logging
 import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# PDFium ends text lines with "\r\n", usually after a trailing space
+PDFIUM_LINE_BREAK = re.compile(r"[ \t]*\r\n")
+# PDFium marks a word hyphenated across a line break with \x02; dropping it
+# rejoins the word
+PDFIUM_HYPHEN_MARKER = "\x02"
+# Joins page texts into the document's raw text
+PAGE_SEPARATOR = "\n\n"
+
+
+def _extract_page_texts(path: str) -> list[dict]:
+    """
+    Extracts the text of every page with PDFium, which runs in C++ and follows the
+    column reading order of multi-column layouts.
+    Returns a list of {"text": str, "page_number": int} with 1-based page numbers.
+    """
+    try:
+        pdf = pdfium.PdfDocument(path)
+    except FileNotFoundError:
+        raise NoSuchDocumentError(f"File not found: {path}")
+
+    page_data_list = []
+    try:
+        for page_index in range(len(pdf)):
+            page = pdf[page_index]
+            text_page = page.get_textpage()
+            text = text_page.get_text_bounded()
+            text_page.close()
+            page.close()
+            text = PDFIUM_LINE_BREAK.sub("\n", text).replace(PDFIUM_HYPHEN_MARKER, "")
+            page_data_list.append(
+                {"text": text.rstrip(), "page_number": page_index + 1}
+            )
+    finally:
+        pdf.close()
+    return page_data_list
 
 
 def parse_pdf(path: str, document_id: str) -> tuple[str, list[DocumentSegment]]:
     return __parse_and_segment_langchain(path, document_id)
 
 
-# TODO: Optimize this?
 def __parse_and_segment_langchain(
     path: str,
     document_id: str,
@@ -16,17 +57,11 @@ def __parse_and_segment_langchain(
     chunk_overlap: int = 200,
 ) -> tuple[str, list[DocumentSegment]]:
     # 1) Extract text page by page and prepare for full raw text concatenation
-    page_data_list = []  # Stores dicts of {"text": str, "page_number": int}
     try:
-        with pdfplumber.open(path) as pdf:
-            if not pdf.pages:
-                return "", []  # Handle PDF with no pages
-            for page in pdf.pages:
-                page_data_list.append(
-                    {"text": page.extract_text() or "", "page_number": page.page_number}
-                )
-    except Exception as e:
-        print(f"Error opening or processing PDF {path}: {e}")
+        # Stores dicts of {"text": str, "page_number": int}
+        page_data_list = _extract_page_texts(path)
+    except pdfium.PdfiumError as e:
+        logger.warning("Error opening or processing PDF %s: %s", path, e)
         return "", []
 
     if not page_data_list:
@@ -37,24 +72,20 @@ def __parse_and_segment_langchain(
     page_char_start_map = []  # List of tuples: (character_offset_in_raw, page_number)
     current_char_offset = 0
 
-    for i, p_data in enumerate(page_data_list):
+    for p_data in page_data_list:
         page_text = p_data["text"]
-        page_number = p_data["page_number"]
 
-        page_char_start_map.append((current_char_offset, page_number))
+        page_char_start_map.append((current_char_offset, p_data["page_number"]))
         raw_parts.append(page_text)
+        current_char_offset += len(page_text) + len(PAGE_SEPARATOR)
 
-        current_char_offset += len(page_text)
-        if i < len(page_data_list) - 1:  # If not the last page, add separator length
-            current_char_offset += 2  # For "\\n\\n"
-
-    raw = "\\n\\n".join(raw_parts)
+    raw = PAGE_SEPARATOR.join(raw_parts)
 
     # 3) Configure text splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        separators=["\\n\\n", "\\n", " ", ""],
+        separators=["\n\n", "\n", " ", ""],
         length_function=len,
         is_separator_regex=False,
     )
@@ -65,6 +96,8 @@ def __parse_and_segment_langchain(
     # 5) Build DocumentSegment objects, now with page numbers
     segments: list[DocumentSegment] = []
     current_search_cursor = 0
+    # Sorted page start offsets, for a binary search of each chunk's page
+    page_start_offsets = [offset for offset, _ in page_char_start_map]
 
     # Construct the public URL for the PDF
     pdf_filename = os.path.basename(path)
@@ -74,40 +107,50 @@ def __parse_and_segment_langchain(
 
     for i, text_chunk in enumerate(split_texts):
         # Skip chunks that are empty or contain only whitespace (e.g., "\n", "  ", "\t\n ")
-        s_text_chunk = text_chunk.strip()
-        if not s_text_chunk or s_text_chunk == "\\n":
+        if not text_chunk or text_chunk.isspace():
             continue
+        chunk_length = len(text_chunk)
+
+        # The chunk starts after the previous chunk's start and at most a chunk
+        # length (plus skipped whitespace) later, so the search is bounded to that
+        # window instead of scanning to the end of the document on a miss
+        chunk_start_index = raw.find(
+            text_chunk,
+            current_search_cursor,
+            current_search_cursor + chunk_size + chunk_overlap + chunk_length,
+        )
 
-        chunk_start_index = raw.find(text_chunk, current_search_cursor)
-
         if chunk_start_index == -1:
-            # Fallback: try searching from beginning if not found with cursor
-            chunk_start_index_fallback = raw.find(text_chunk)
-            if chunk_start_index_fallback != -1:
-                chunk_start_index = chunk_start_index_fallback
-            else:  # Still not found, this chunk is problematic
+            # Fallback: search the rest of the document, e.g. after a long run of
+            # whitespace the splitter dropped between two chunks
+            chunk_start_index = raw.find(text_chunk, current_search_cursor)
+        if chunk_start_index == -1:
+            # Last resort: search from the beginning; a chunk that only occurs before
+            # the cursor may match an earlier copy of repeated text
+            chunk_start_index = raw.find(text_chunk)
+            if chunk_start_index == -1:  # Still not found, this chunk is problematic
                 # Assign a default page (e.g., first page if available, or 0) and log.
                 page_for_lost_chunk = (
                     page_char_start_map[0][1] if page_char_start_map else 0
                 )
-                print(
-                    f"Warning: Text chunk not found in raw PDF text. Page assigned: {page_for_lost_chunk}. Chunk: '{text_chunk[:100]}...'"
+                logger.debug(
+                    "Text chunk not found in raw PDF text. Page assigned: %s. Chunk: '%s...'",
+                    page_for_lost_chunk,
+                    text_chunk[:100],
                 )
                 # Decide whether to skip or create a segment with potentially inaccurate data.
                 # For now, skipping problematic chunks:
                 continue
 
-        chunk_end_index = chunk_start_index + len(text_chunk)
+        chunk_end_index = chunk_start_index + chunk_length
 
         # Determine the page number for this chunk
         assigned_page_number = 0  # Default if no pages or error
-        if page_char_start_map:
-            # Iterate backwards through page start markers.
-            # The first one (i.e., largest page number) whose start offset is <= chunk's start is the correct page.
-            for offset, page_num in reversed(page_char_start_map):
-                if chunk_start_index >= offset:
-                    assigned_page_number = page_num
-                    break
+        # The last page (i.e., largest page number) whose start offset is <= chunk's
+        # start is the correct page
+        page_position = bisect.bisect_right(page_start_offsets, chunk_start_index) - 1
+        if page_position >= 0:
+            assigned_page_number = page_char_start_map[page_position][1]
 
         segments.append(
             DocumentSegment(
@@ -122,7 +165,9 @@ def __parse_and_segment_langchain(
             )
         )
 
-        # Update cursor to search for the next chunk after the end of the current one
-        current_search_cursor = chunk_end_index
+        # Chunks overlap by up to chunk_overlap characters, so the next chunk starts
+        # after this chunk's start rather than after its end; searching from the end
+        # missed most overlapping chunks and fell back to scanning from the beginning
+        current_search_cursor = chunk_start_index + 1
 
     return raw, segments
@@ -0,0 +1,39 @@
+import pytest
+
+import analysis.topic_modeling as topic_modeling
+from analysis.topic_modeling import detect_language
+
+
+def test_clear_majority_is_decided_by_stopwords(monkeypatch):
+    """Texts with a clear stopword majority never reach langdetect."""
+
+    def fail(text):
+        raise AssertionError("langdetect should not be called")
+
+    monkeypatch.setattr(topic_modeling, "detect", fail)
+    assert (
+        detect_language("vi vill att skolan ska vara en plats där alla elever kan")
+        == "sv"
+    )
+    assert (
+        detect_language("we want the school to be a place where all of the pupils can")
+        == "en"
+    )
+    # A short English quote doesn't outweigh the surrounding Swedish text
+    assert (
+        detect_language(
+            "partiet säger att de vill ha mer av det för alla, och deras slogan är 'we can do it'"
+        )
+        == "sv"
+    )
+
+
+@pytest.mark.parametrize(
+    "detected, expected",
+    [("sv", "sv"), ("no", "sv"), ("da", "sv"), ("en", "en"), ("de", "en")],
+)
+def test_ambiguous_text_maps_langdetect_codes(monkeypatch, detected, expected):
+    """Without a clear stopword majority, langdetect codes are mapped to sv or en."""
+    monkeypatch.setattr(topic_modeling, "detect", lambda text: detected)
+    # One Swedish-only and one English-only stopword: too few hits to decide
+    assert detect_language("skolan och the budget") == expected
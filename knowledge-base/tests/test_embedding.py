@@ -1,6 +1,12 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import numpy as np
 import pytest
 
 from analysis.embedding import EmbeddingClient
+from analysis.embedding_cache import EmbeddingCache
 from model import Document, DocumentSegment
 
 
@@ -42,10 +48,292 @@ async def test_get_embedding_success(embedding_client: EmbeddingClient):
     # assert len(updated_documents) == 1
     assert updated_documents[0].segments[0].embedding is not None
     assert updated_documents[0].segments[1].embedding is not None
-    import numpy as np
-
     assert not np.array_equal(
         updated_documents[0].segments[0].embedding,
         updated_documents[0].segments[1].embedding,
     )
     assert len(updated_documents[0].segments[0].embedding) == 1536
+
+
+def _encode(vector: list[float]) -> str:
+    """Encodes a vector the way the API does for encoding_format="base64"."""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    async def create(self, input, model, encoding_format):
+        assert encoding_format == "base64"
+        self.calls.append(list(input))
+        # Return the data out of order to exercise index-based reordering
+        data = [
+            SimpleNamespace(index=i, embedding=_encode([float(len(text)), 1.0]))
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+class _FakeClient:
+    def __init__(self):
+        self.embeddings = _FakeEmbeddings()
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_batches_requests():
+    """Segments are sent in batches and embeddings are matched back by index."""
+    fake_client = _FakeClient()
+    client = EmbeddingClient(client=fake_client, batch_size=2)
+    texts = ["a", "bb\nb", "ccc", "dddd", "eeeee"]
+    documents = [
+        Document(
+            id="doc",
+            raw_content="",
+            path="test.txt",
+            segments=[
+                DocumentSegment(
+                    id=f"doc-{i}",
+                    text=text,
+                    start_index=0,
+                    end_index=len(text),
+                    page=1,
+                )
+                for i, text in enumerate(texts)
+            ],
+        )
+    ]
+
+    updated_documents = [doc async for doc in client.embed_documents(documents)]
+
+    assert [len(call) for call in fake_client.embeddings.calls] == [2, 2, 1]
+    assert fake_client.embeddings.calls[0] == ["a", "bb b"]
+    for segment in updated_documents[0].segments:
+        # Embeddings are unit-normalized, so compare the direction of the vector
+        ratio = segment.embedding[0] / segment.embedding[1]
+        assert ratio == pytest.approx(len(segment.text), rel=1e-2)
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_reuses_cached_embeddings():
+    """Text embedded once is served from the cache on subsequent runs."""
+    fake_client = _FakeClient()
+    client = EmbeddingClient(client=fake_client, cache=EmbeddingCache(":memory:"))
+
+    def make_documents():
+        return [
+            Document(
+                id="doc",
+                raw_content="",
+                path="test.txt",
+                segments=[
+                    DocumentSegment(
+                        id="doc-0",
+                        text="cached text",
+                        start_index=0,
+                        end_index=11,
+                        page=1,
+                    )
+                ],
+            )
+        ]
+
+    first_run = [doc async for doc in client.embed_documents(make_documents())]
+    second_run = [doc async for doc in client.embed_documents(make_documents())]
+
+    assert len(fake_client.embeddings.calls) == 1
+    # Cache hits return exactly the vector the API returned
+    np.testing.assert_array_equal(
+        second_run[0].segments[0].embedding, first_run[0].segments[0].embedding
+    )
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_batches_across_documents():
+    """Segments from different documents share requests and every document is yielded."""
+    fake_client = _FakeClient()
+    client = EmbeddingClient(client=fake_client, batch_size=4)
+    documents = [
+        Document(
+            id=f"doc{d}",
+            raw_content="",
+            path=f"doc{d}.txt",
+            segments=[
+                DocumentSegment(
+                    id=f"doc{d}-{i}",
+                    text=f"{d}" * (i + 1),
+                    start_index=0,
+                    end_index=i + 1,
+                    page=1,
+                )
+                for i in range(2)
+            ],
+        )
+        for d in range(3)
+    ]
+
+    updated_documents = [doc async for doc in client.embed_documents(documents)]
+
+    assert [len(call) for call in fake_client.embeddings.calls] == [4, 2]
+    assert sorted(doc.id for doc in updated_documents) == ["doc0", "doc1", "doc2"]
+    for doc in updated_documents:
+        assert doc.embedding_matrix is not None
+        assert doc.embedding_matrix.shape == (2, 2)
+
+
+class _FakeBatchApiClient:
+    """Minimal stand-in for the files and batches endpoints of the Batch API."""
+
+    def __init__(self, failing_custom_id: str | None = None):
+        self.failing_custom_id = failing_custom_id
+        # Uploaded requests of every job, one list per input file
+        self.jobs: list[list[dict]] = []
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(
+            create=self._create_batch, retrieve=self._retrieve_batch
+        )
+
+    async def _create_file(self, file, purpose):
+        assert purpose == "batch"
+        self.jobs.append([json.loads(line) for line in file[1].decode().splitlines()])
+        return SimpleNamespace(id="file-in")
+
+    async def _create_batch(self, input_file_id, endpoint, completion_window):
+        return SimpleNamespace(id="batch-1", status="in_progress", output_file_id=None)
+
+    async def _retrieve_batch(self, batch_id):
+        return SimpleNamespace(
+            id=batch_id, status="completed", output_file_id="file-out"
+        )
+
+    def _result_line(self, request: dict) -> str:
+        if request["custom_id"] == self.failing_custom_id:
+            return json.dumps(
+                {
+                    "custom_id": request["custom_id"],
+                    "response": None,
+                    "error": {"code": "server_error", "message": "boom"},
+                }
+            )
+        embedding = _encode([float(len(request["body"]["input"])), 1.0])
+        return json.dumps(
+            {
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"data": [{"index": 0, "embedding": embedding}]},
+                },
+                "error": None,
+            }
+        )
+
+    async def _content(self, file_id):
+        # Output lines are returned out of order, like the real Batch API may
+        lines = [self._result_line(request) for request in reversed(self.jobs[-1])]
+        return SimpleNamespace(text="\n".join(lines))
+
+
+def _batch_api_documents(texts: list[str]) -> list[Document]:
+    return [
+        Document(
+            id="doc",
+            raw_content="",
+            path="test.txt",
+            segments=[
+                DocumentSegment(
+                    id=f"doc-{i}",
+                    text=text,
+                    start_index=0,
+                    end_index=len(text),
+                    page=1,
+                )
+                for i, text in enumerate(texts)
+            ],
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_batch_api_maps_results_by_custom_id():
+    """Batch API results are mapped back onto segments by their IDs."""
+    client = EmbeddingClient(client=_FakeBatchApiClient())
+
+    updated_documents = await client.embed_documents_batch_api(
+        _batch_api_documents(["ab", "abcd"]), poll_interval=0
+    )
+
+    ratios = [
+        seg.embedding[0] / seg.embedding[1] for seg in updated_documents[0].segments
+    ]
+    assert ratios == [pytest.approx(2, rel=1e-2), pytest.approx(4, rel=1e-2)]
+    assert updated_documents[0].embedding_matrix.shape == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_batch_api_raises_on_failed_request():
+    """A failed request in the batch output aborts instead of leaving a segment unembedded."""
+    client = EmbeddingClient(client=_FakeBatchApiClient(failing_custom_id="doc-1"))
+
+    with pytest.raises(RuntimeError, match="doc-1"):
+        await client.embed_documents_batch_api(
+            _batch_api_documents(["ab", "abcd"]), poll_interval=0
+        )
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_batch_api_splits_jobs(monkeypatch):
+    """Segments beyond MAX_BATCH_API_REQUESTS are submitted as further jobs."""
+    monkeypatch.setattr(EmbeddingClient, "MAX_BATCH_API_REQUESTS", 2)
+    fake_client = _FakeBatchApiClient()
+    client = EmbeddingClient(client=fake_client)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    updated_documents = await client.embed_documents_batch_api(
+        _batch_api_documents(texts), poll_interval=0
+    )
+
+    assert [len(job) for job in fake_client.jobs] == [2, 2, 1]
+    assert [request["custom_id"] for job in fake_client.jobs for request in job] == [
+        f"doc-{i}" for i in range(len(texts))
+    ]
+    for segment in updated_documents[0].segments:
+        ratio = segment.embedding[0] / segment.embedding[1]
+        assert ratio == pytest.approx(len(segment.text), rel=1e-2)
+
+
+@pytest.mark.asyncio
+async def test_embed_documents_deduplicates_identical_texts():
+    """Identical texts across documents are sent to the API only once."""
+    fake_client = _FakeClient()
+    client = EmbeddingClient(client=fake_client)
+    documents = [
+        Document(
+            id=f"doc{d}",
+            raw_content="",
+            path=f"doc{d}.txt",
+            segments=[
+                DocumentSegment(
+                    id=f"doc{d}-0",
+                    text="shared footer",
+                    start_index=0,
+                    end_index=13,
+                    page=1,
+                ),
+                DocumentSegment(
+                    id=f"doc{d}-1",
+                    text=f"unique {d}",
+                    start_index=14,
+                    end_index=22,
+                    page=1,
+                ),
+            ],
+        )
+        for d in range(2)
+    ]
+
+    updated_documents = [doc async for doc in client.embed_documents(documents)]
+
+    assert fake_client.embeddings.calls == [["shared footer", "unique 0", "unique 1"]]
+    assert len(updated_documents) == 2
+    for doc in updated_documents:
+        assert all(seg.embedding is not None for seg in doc.segments)
@@ -0,0 +1,25 @@
+import json
+
+from parser.json_website_parser import parse_json
+
+
+def test_segment_offsets_index_into_raw_content(tmp_path):
+    """Segment start/end indices slice their text out of raw_content, also after skipped items."""
+    path = tmp_path / "site.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"url": "https://a.example", "content": "first page"},
+                {"url": "https://b.example"},
+                {"url": "https://c.example", "content": "second page"},
+            ]
+        ),
+        encoding="utf-8",
+    )
+
+    raw_content, segments = parse_json(str(path), "doc")
+
+    assert raw_content == "first page\n\nsecond page"
+    assert [seg.id for seg in segments] == ["doc-1", "doc-3"]
+    for seg in segments:
+        assert raw_content[seg.start_index : seg.end_index] == seg.text
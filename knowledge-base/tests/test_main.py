@@ -0,0 +1,24 @@
+import json
+
+from main import iter_and_parse_documents
+
+
+def test_document_ids_follow_discovery_order(tmp_path):
+    """Largest files are parsed first, but document IDs still follow discovery order."""
+    documents_dir = tmp_path / "documents" / "party"
+    documents_dir.mkdir(parents=True)
+    # Sizes grow with the name, so submission order is the reverse of discovery order
+    for size, name in enumerate(["a.json", "b.json", "c.json"], start=1):
+        (documents_dir / name).write_text(
+            json.dumps([{"url": "https://example.com", "content": "x" * 1000 * size}]),
+            encoding="utf-8",
+        )
+
+    documents = iter_and_parse_documents(tmp_path / "documents", project_root=tmp_path)
+
+    ids_by_path = {doc.path: doc.id for doc in documents}
+    assert ids_by_path == {
+        "documents/party/a.json": "0",
+        "documents/party/b.json": "1",
+        "documents/party/c.json": "2",
+    }
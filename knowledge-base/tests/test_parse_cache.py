@@ -0,0 +1,86 @@
+import json
+
+import parser as parser_module
+from parser import parse_cache_dir_for, parse_document_cached, prune_parse_cache
+
+
+def _write_site(path, content: str) -> None:
+    path.write_text(
+        json.dumps([{"url": "https://a.example", "content": content}]),
+        encoding="utf-8",
+    )
+
+
+def test_parse_cache_reuses_unchanged_files(tmp_path, monkeypatch):
+    """Unchanged files are served from the parse cache; modified files are parsed again."""
+    path = tmp_path / "site.json"
+    _write_site(path, "first")
+    cache_dir = tmp_path / "parse-cache"
+
+    parsed = parse_document_cached(str(path), "doc", cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+
+    def fail(*args):
+        raise AssertionError("cached document was parsed again")
+
+    monkeypatch.setattr(parser_module, "parse_json", fail)
+    assert parse_document_cached(str(path), "doc", cache_dir) == parsed
+    monkeypatch.undo()
+
+    _write_site(path, "changed content")
+    (segment,) = parse_document_cached(str(path), "doc", cache_dir).segments
+    assert segment.text == "changed content"
+
+
+def test_parse_cache_rewrites_ids_on_hit(tmp_path):
+    """A cache entry is reused when the document ID changes, with its IDs rewritten."""
+    path = tmp_path / "site.json"
+    _write_site(path, "first")
+    cache_dir = tmp_path / "parse-cache"
+
+    parse_document_cached(str(path), "3", cache_dir)
+    document = parse_document_cached(str(path), "4", cache_dir)
+
+    assert len(list(cache_dir.iterdir())) == 1
+    assert document.id == "4"
+    assert [segment.id for segment in document.segments] == ["4-1"]
+
+
+def test_prune_parse_cache_deletes_stale_entries(tmp_path):
+    """Entries of modified or removed files are pruned; current entries are kept."""
+    kept, modified, removed = (tmp_path / f"{name}.json" for name in "abc")
+    for path in (kept, modified, removed):
+        _write_site(path, "first")
+    cache_dir = tmp_path / "parse-cache"
+    for i, path in enumerate((kept, modified, removed)):
+        parse_document_cached(str(path), str(i), cache_dir)
+
+    _write_site(modified, "changed content")
+    removed.unlink()
+    in_flight = cache_dir / "0123.42.tmp"
+    in_flight.write_text("{}", encoding="utf-8")
+
+    # `removed` is still listed, as if it vanished after discovery
+    assert prune_parse_cache(cache_dir, [str(kept), str(modified), str(removed)]) == 2
+    assert in_flight.exists()
+    in_flight.unlink()
+    (entry,) = cache_dir.iterdir()
+    assert json.loads(entry.read_text(encoding="utf-8"))["path"] == str(kept)
+
+
+def test_parse_cache_dir_is_per_documents_root(tmp_path):
+    """Pruning the cache of one documents root keeps the entries of another."""
+    cache_root = tmp_path / "parse-cache"
+    first_root, second_root = tmp_path / "first", tmp_path / "second"
+    first_root.mkdir()
+    second_root.mkdir()
+    _write_site(first_root / "site.json", "first")
+    _write_site(second_root / "site.json", "second")
+    first_dir = parse_cache_dir_for(cache_root, first_root)
+    second_dir = parse_cache_dir_for(cache_root, second_root)
+    assert first_dir != second_dir
+    parse_document_cached(str(first_root / "site.json"), "0", first_dir)
+    parse_document_cached(str(second_root / "site.json"), "0", second_dir)
+
+    assert prune_parse_cache(second_dir, [str(second_root / "site.json")]) == 0
+    assert len(list(first_dir.iterdir())) == 1
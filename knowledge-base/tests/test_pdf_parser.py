@@ -0,0 +1,25 @@
+from parser import pdf_parser
+from parser.pdf_parser import parse_pdf
+
+
+def test_repeated_text_beyond_search_window_keeps_its_own_offsets(monkeypatch):
+    """A chunk repeated after a long whitespace gap is located at its own copy, not the earlier one."""
+    passage = " ".join(f"word{i}" for i in range(250))
+    pages = [passage, "\n" * 6000 + passage]
+    monkeypatch.setattr(
+        pdf_parser,
+        "_extract_page_texts",
+        lambda path: [
+            {"text": text, "page_number": number}
+            for number, text in enumerate(pages, start=1)
+        ],
+    )
+
+    raw, segments = parse_pdf("documents/party/manifest.pdf", "doc")
+
+    assert [seg.text for seg in segments] == [passage, passage]
+    first, second = segments
+    assert (first.start_index, first.page) == (0, 1)
+    assert (second.start_index, second.page) == (raw.rindex(passage), 2)
+    for seg in segments:
+        assert raw[seg.start_index : seg.end_index] == seg.text
@@ -0,0 +1,118 @@
+import base64
+import json
+
+import numpy as np
+
+from model import Document, DocumentSegment, Topic
+from model.store import (
+    load_documents_from_json,
+    load_topics_from_json,
+    store_document_as_json,
+    store_topics_as_json,
+)
+
+
+def _document(embedding) -> Document:
+    return Document(
+        id="doc",
+        path="documents/test.pdf",
+        raw_content="text",
+        segments=[
+            DocumentSegment(id="doc-0", text="", start_index=0, end_index=0, page=1),
+            DocumentSegment(
+                id="doc-1",
+                text="text",
+                start_index=0,
+                end_index=4,
+                page=1,
+                embedding=embedding,
+            ),
+        ],
+    )
+
+
+def test_document_embeddings_round_trip_through_npy_sidecar(tmp_path):
+    """Segment embeddings are stored in a .npy sidecar, not in the document JSON."""
+    embedding = np.linspace(-1.0, 1.0, 1536, dtype=np.float32)
+    store_document_as_json(_document(embedding), tmp_path)
+
+    data = json.loads((tmp_path / "test.json").read_text(encoding="utf-8"))
+    assert all("embedding" not in seg for seg in data["segments"])
+    assert [seg["embedding_row"] for seg in data["segments"]] == [None, 0]
+    assert np.load(tmp_path / "test.npy").shape == (1, 1536)
+
+    (loaded,) = load_documents_from_json(tmp_path)
+    assert loaded.segments[0].embedding is None
+    np.testing.assert_array_equal(loaded.segments[1].embedding, embedding)
+
+    # Rewriting a document whose embeddings are mapped from the same sidecar
+    store_document_as_json(loaded, tmp_path)
+    (reloaded,) = load_documents_from_json(tmp_path)
+    np.testing.assert_array_equal(reloaded.segments[1].embedding, embedding)
+
+
+def test_inline_document_embeddings_still_load(tmp_path):
+    """Document JSON written before sidecars, with inline embeddings, still loads."""
+    document = _document([0.5, 1.0])
+    (tmp_path / "test.json").write_text(document.model_dump_json(), encoding="utf-8")
+
+    (loaded,) = load_documents_from_json(tmp_path)
+    np.testing.assert_array_equal(loaded.segments[1].embedding, [0.5, 1.0])
+
+
+def test_topic_embeddings_round_trip_as_base64(tmp_path):
+    """Topic embeddings are stored as base64 float32 bytes and restored unchanged."""
+    embedding = np.linspace(-1.0, 1.0, 1536, dtype=np.float32)
+    store_topics_as_json(
+        [Topic(id=0, name="topic", description="", embedding=embedding)], tmp_path
+    )
+
+    data = json.loads((tmp_path / "topics.json").read_text(encoding="utf-8"))
+    assert set(data[0]["embedding"]) == {"__np__"}
+
+    (loaded_topic,) = load_topics_from_json(tmp_path)
+    np.testing.assert_array_equal(loaded_topic.embedding, embedding)
+
+
+def test_list_embeddings_still_load():
+    """JSON written before the base64 encoding is still accepted."""
+    segment = DocumentSegment(
+        id="doc-0", text="", start_index=0, end_index=0, page=1, embedding=[0.5, 1.0]
+    )
+    assert segment.embedding.dtype == np.float32
+    np.testing.assert_array_equal(segment.embedding, [0.5, 1.0])
+
+
+def test_base64_and_raw_byte_embeddings_are_decoded():
+    """Embeddings given as base64 strings or raw float32 bytes decode directly."""
+    embedding = np.arange(4, dtype=np.float32)
+    from_bytes = DocumentSegment(
+        id="doc-0",
+        text="",
+        start_index=0,
+        end_index=0,
+        page=1,
+        embedding=embedding.tobytes(),
+    )
+    from_base64 = Topic(
+        id=0,
+        name="topic",
+        description="",
+        embedding=base64.b64encode(embedding.tobytes()).decode("ascii"),
+    )
+    np.testing.assert_array_equal(from_bytes.embedding, embedding)
+    np.testing.assert_array_equal(from_base64.embedding, embedding)
+
+
+def test_packed_embeddings_keep_float32_values(tmp_path):
+    """Packing into the document matrix is lossless and matches the dtype loaded from disk."""
+    embedding = np.linspace(-1.0, 1.0, 1536, dtype=np.float32) / 3
+    document = _document(embedding)
+    document.pack_embeddings()
+
+    assert document.embedding_matrix.dtype == np.float32
+    np.testing.assert_array_equal(document.segments[1].embedding, embedding)
+
+    store_document_as_json(document, tmp_path)
+    (loaded,) = load_documents_from_json(tmp_path)
+    assert loaded.embedding_matrix.dtype == document.embedding_matrix.dtype
@@ -3,7 +3,8 @@ import pytest
 from model import (
     DocumentSegment,
 )
-from analysis.topic_modeling import extract_topics, BERTopic
+from analysis.topic_modeling import extract_topics
+from bertopic import BERTopic
 from analysis.embedding import EmbeddingClient
 
 